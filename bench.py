@@ -0,0 +1,269 @@
+"""Micro-benchmarks for the hotel data fetcher in test.py.
+
+Usage: python bench.py {codec,geo,memory,parse,snapshot,text} [--count N]
+"""
+from dataclasses import field, fields, make_dataclass
+from typing import List, Dict, Optional, Any, Callable
+import importlib.util
+import json
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Registered under the name the tests use, which is also how the parser
+# pool's worker processes find the application's functions
+_spec = importlib.util.spec_from_file_location('hotels', os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                                       'test.py'))
+hotels = importlib.util.module_from_spec(_spec)
+sys.modules['hotels'] = hotels
+_spec.loader.exec_module(hotels)
+
+from hotels import (AMENITY_CATEGORIES, CODECS, Amenities, CatalogSnapshot, Hotel, HotelService, Image, Images,
+                    JsonCodec, Location, PaperfliesSupplier, ParserPool, TextIndex, haversine_km, orjson)
+
+def synthetic_payload(count: int) -> List[Dict]:
+    """Paperflies-shaped supplier records for benchmarks"""
+    return [{
+        'hotel_id': f'h{i:07d}',
+        'destination_id': i % 5000,
+        'hotel_name': f'Hotel {i}',
+        'location': {'address': f'{i} Example Road', 'country': 'Singapore'},
+        'details': 'A comfortable hotel close to the city centre with easy access to public transport. ' * 3,
+        'amenities': {
+            'general': ['outdoor pool', 'indoor pool', 'business center', 'childcare', 'wifi'],
+            'room': ['tv', 'coffee machine', 'kettle', 'hair dryer', 'iron']
+        },
+        'images': {
+            'rooms': [{'link': f'https://img.example.com/{i}/room-{n}.jpg', 'caption': 'Double room'}
+                      for n in range(3)],
+            'site': [{'link': f'https://img.example.com/{i}/site.jpg', 'caption': 'Front'}]
+        },
+        'booking_conditions': ['All children are welcome.', 'Pets are not allowed.']
+    } for i in range(count)]
+
+def best_of(repeat: int, func: Callable[[], Any]) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def benchmark_codecs(count: int, repeat: int = 3) -> None:
+    payload = json.dumps(synthetic_payload(count)).encode('utf-8')
+    supplier = PaperfliesSupplier()
+    documents = [supplier.parse(item).to_dict() for item in json.loads(payload)]
+    # Values each backend writes differently, which must still come out identical
+    documents.append({'lat': 0.00005, 'lng': 1e-7, 'big': 1e16, 'nan': float('nan'),
+                      'text': 'caf\u00e9 \x7f \u2603', 'none': None})
+    reference = [JsonCodec().dumps(document, indent=True) for document in documents]
+    print(f"{count} hotels, {len(payload) / 1e6:.1f} MB supplier payload (best of {repeat})")
+
+    for name, cls in CODECS.items():
+        if name == 'orjson' and orjson is None:
+            print(f"  {name:<8} not installed")
+            continue
+        backend = cls()
+        decode = best_of(repeat, lambda: backend.loads(payload))
+        encode = best_of(repeat, lambda: [backend.dumps(document, indent=True) for document in documents])
+        identical = [backend.dumps(document, indent=True) for document in documents] == reference
+        print(f"  {name:<8} decode {decode * 1000:9.1f} ms   encode {encode * 1000:9.1f} ms"
+              f"   output {'identical' if identical else 'DIFFERS'}")
+
+def benchmark_parse(count: int, workers: Optional[int] = None, repeat: int = 3) -> None:
+    payload = json.dumps(synthetic_payload(count)).encode('utf-8')
+    supplier = PaperfliesSupplier()
+    pool = ParserPool(workers, threshold=0)
+    print(f"{count} hotels, {len(payload) / 1e6:.1f} MB supplier payload (best of {repeat})")
+
+    async def offloaded() -> List[Hotel]:
+        return await pool.parse(supplier, 'bench', payload)
+
+    try:
+        inline = best_of(repeat, lambda: supplier.load('bench', payload, {}))
+        pooled = best_of(repeat, lambda: asyncio.run(offloaded()))
+        identical = asyncio.run(offloaded()) == supplier.load('bench', payload, {})
+    finally:
+        pool.shutdown()
+    print(f"  in process     {inline * 1000:9.1f} ms")
+    print(f"  {workers or os.cpu_count():>2} processes   {pooled * 1000:9.1f} ms"
+          f"   output {'identical' if identical else 'DIFFERS'}")
+
+def benchmark_geo(count: int, queries: int = 1000) -> None:
+    """Radius and bounding-box queries against the spatial index and a linear scan"""
+    rng = random.Random(0)
+    cities = [(rng.uniform(-50.0, 60.0), rng.uniform(-180.0, 180.0)) for _ in range(1000)]
+    service = HotelService()
+    for i in range(count):
+        lat, lng = cities[i % len(cities)]
+        service.merge_hotels((Hotel(id=f'h{i:07d}', destination_id=str(i % len(cities)), name=f'Hotel {i}',
+                                    location=Location(lat=lat + rng.gauss(0.0, 0.05),
+                                                      lng=lng + rng.gauss(0.0, 0.05))),))
+    points = [cities[rng.randrange(len(cities))] for _ in range(queries)]
+    print(f"{count} hotels, {queries} queries around random cities")
+
+    start = time.perf_counter()
+    found = sum(len(service.find(radius=(lat, lng, 5.0))) for lat, lng in points)
+    indexed = (time.perf_counter() - start) / queries
+    print(f"  radius 5 km   index {indexed * 1000:8.3f} ms/query   {found / queries:6.0f} hotels/query")
+
+    start = time.perf_counter()
+    found = sum(len(service.find(bbox=(lat - 0.05, lng - 0.05, lat + 0.05, lng + 0.05))) for lat, lng in points)
+    indexed = (time.perf_counter() - start) / queries
+    print(f"  bbox 0.1 deg  index {indexed * 1000:8.3f} ms/query   {found / queries:6.0f} hotels/query")
+
+    lat, lng = points[0]
+    start = time.perf_counter()
+    scanned = [hotel for hotel in service.hotels.values()
+               if haversine_km(lat, lng, hotel.location.lat, hotel.location.lng) <= 5.0]
+    scan = time.perf_counter() - start
+    identical = {hotel.id for hotel in scanned} == {hotel.id for hotel in service.find(radius=(lat, lng, 5.0))}
+    print(f"  radius 5 km   scan  {scan * 1000:8.3f} ms/query   results {'identical' if identical else 'DIFFER'}")
+
+def benchmark_text(count: int, queries: int = 1000, limit: int = 10) -> None:
+    """Top-k text queries against the inverted index and a scan over descriptions"""
+    rng = random.Random(0)
+    vocabulary = [f'word{n}' for n in range(20000)]
+    amenities = sorted(AMENITY_CATEGORIES)
+    service = HotelService()
+    for i in range(count):
+        words = rng.choices(vocabulary, k=40)
+        service.merge_hotels((Hotel(id=f'h{i:07d}', destination_id=str(i % 5000),
+                                    name=f'Hotel {" ".join(rng.choices(vocabulary, k=2))}',
+                                    description=' '.join(words),
+                                    amenities=Amenities(general=rng.sample(amenities, 5))),))
+    texts = [' '.join(rng.choices(vocabulary, k=2) + rng.sample(amenities, 1)) for _ in range(queries)]
+    print(f"{count} hotels, {queries} queries of 3 words, top {limit}")
+
+    start = time.perf_counter()
+    for text in texts:
+        service.find(text=text, limit=limit)
+    indexed = (time.perf_counter() - start) / queries
+    print(f"  index {indexed * 1000:9.3f} ms/query")
+
+    words = set(TextIndex.tokenize(texts[0]))
+    start = time.perf_counter()
+    [hotel for hotel in service.hotels.values() if words & set(TextIndex.tokenize(hotel.description))]
+    print(f"  scan  {(time.perf_counter() - start) * 1000:9.3f} ms/query (unranked)")
+
+MODELS = (Location, Image, Amenities, Images, Hotel)
+
+def unslotted_models() -> Dict[str, type]:
+    """Plain __dict__-backed copies of the models, as a memory baseline"""
+    return {cls.__name__: make_dataclass(cls.__name__, [
+        (f.name, f.type, field(default=f.default, default_factory=f.default_factory, init=f.init))
+        for f in fields(cls)
+    ]) for cls in MODELS}
+
+def build_hotels(models: Dict[str, type], count: int) -> List[Any]:
+    """Acme-like records of count hotels"""
+    Location, Image, Amenities, Images, Hotel = (models[cls.__name__] for cls in MODELS)
+    return [Hotel(
+        id=f'h{i:07d}',
+        destination_id=str(i % 5000),
+        name=f'Hotel {i}',
+        location=Location(lat=1.0 + i * 1e-6, lng=103.0 + i * 1e-6, address=f'{i} Example Road',
+                          city='Singapore', country='SG'),
+        description='A comfortable hotel close to the city centre.',
+        amenities=Amenities(general=['business center', 'pool', 'wifi'], room=['aircon', 'tv']),
+        images=Images(
+            rooms=[Image(f'https://img.example.com/{i}/room-{n}.jpg', 'Double room') for n in range(2)],
+            site=[Image(f'https://img.example.com/{i}/site.jpg', 'Front')]
+        ),
+        booking_conditions=[],
+        source='acme'
+    ) for i in range(count)]
+
+def build_merged_hotels(count: int) -> List[Hotel]:
+    """The hotels of build_hotels merged with Paperflies-like records of them,
+    which share one image and disagree on most scalar fields"""
+    hotels = build_hotels({cls.__name__: cls for cls in MODELS}, count)
+    for i, hotel in enumerate(hotels):
+        hotel.merge(Hotel(
+            id=f'h{i:07d}',
+            destination_id=str(i % 5000),
+            name=f'The Hotel {i}',
+            location=Location(address=f'{i} Example Road, 049315', country='Singapore'),
+            description='A comfortable hotel close to the city centre, with easy access to public transport.',
+            amenities=Amenities(general=['outdoor pool', 'wifi'], room=['kettle', 'tv']),
+            images=Images(
+                rooms=[Image(f'https://img.example.com/{i}/room-{n}.jpg', 'Double room') for n in range(1, 3)]
+            ),
+            booking_conditions=['All children are welcome.'],
+            source='paperflies'
+        ))
+    return hotels
+
+def traced_bytes(build: Callable[[], Any]) -> int:
+    """Memory still allocated by what build returns"""
+    tracemalloc.start()
+    built = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del built
+    return size
+
+def benchmark_memory(count: int) -> None:
+    print(f"Memory for {count} hotels")
+    results = {}
+    for label, models in (('dict', unslotted_models()), ('slots', {cls.__name__: cls for cls in MODELS})):
+        results[label] = traced_bytes(lambda: build_hotels(models, count)) / count
+        print(f"  {label:<6} {results[label]:8.0f} bytes/hotel   {results[label] * count / 2 ** 20:9.1f} MiB total")
+    print(f"  slots save {1 - results['slots'] / results['dict']:.0%} per hotel")
+    merged = traced_bytes(lambda: build_merged_hotels(count)) / count
+    print(f"  merged {merged:8.0f} bytes/hotel   {merged * count / 2 ** 20:9.1f} MiB total (slots, two suppliers)")
+
+def benchmark_snapshot(count: int) -> None:
+    """Cold start from a catalog snapshot compared with decoding all of it"""
+    hotels = build_hotels({cls.__name__: cls for cls in MODELS}, count)
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'catalog.snapshot')
+        start = time.perf_counter()
+        CatalogSnapshot.write(hotels, path)
+        print(f"{count} hotels, {os.path.getsize(path) / 1e6:.1f} MB snapshot "
+              f"written in {(time.perf_counter() - start) * 1000:.0f} ms")
+        del hotels
+
+        start = time.perf_counter()
+        snapshot = CatalogSnapshot(path)
+        opened = time.perf_counter()
+        snapshot.find([f'h{count // 2:07d}'])
+        by_id = time.perf_counter()
+        found = snapshot.find(destination_ids=['42'])
+        by_destination = time.perf_counter()
+        print(f"  open {(opened - start) * 1000:8.3f} ms   first id query {(by_id - opened) * 1000:8.3f} ms"
+              f"   destination query {(by_destination - by_id) * 1000:8.3f} ms ({len(found)} hotels)")
+        start = time.perf_counter()
+        decoded = len(list(snapshot))
+        print(f"  decoding all {decoded} hotels {(time.perf_counter() - start) * 1000:8.0f} ms")
+        snapshot.close()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Micro-benchmarks')
+    parser.add_argument('target', choices=['codec', 'geo', 'memory', 'parse', 'snapshot', 'text'], help='What to benchmark')
+    parser.add_argument('--count', type=int, help='Number of synthetic hotels (codec, parse, text: 100000, geo, memory, snapshot: 1000000)')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per measurement, best is reported')
+    parser.add_argument('--workers', type=int, help='Worker processes for the parse benchmark (default: one per CPU)')
+
+    args = parser.parse_args()
+
+    if args.target == 'codec':
+        benchmark_codecs(args.count or 100000, args.repeat)
+    elif args.target == 'geo':
+        benchmark_geo(args.count or 1000000)
+    elif args.target == 'memory':
+        benchmark_memory(args.count or 1000000)
+    elif args.target == 'parse':
+        benchmark_parse(args.count or 100000, args.workers, args.repeat)
+    elif args.target == 'snapshot':
+        benchmark_snapshot(args.count or 1000000)
+    elif args.target == 'text':
+        benchmark_text(args.count or 100000)
+
+if __name__ == '__main__':
+    main()
@@ -1,13 +1,92 @@
 from dataclasses import dataclass, field
-from typing import List, Dict, Optional, Any
-from collections import OrderedDict
+from typing import (List, Dict, Optional, Any, Callable, Tuple, Iterable, TextIO, AsyncIterator, Iterator,
+                    Awaitable, FrozenSet, TypeVar)
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from bisect import bisect_left
 import json
 import argparse
 import asyncio
+import contextlib
+import email.utils
+import hashlib
+import heapq
+import io
+import math
+import mmap
+import multiprocessing
+import os
+import random
+import re
+import struct
+import sys
+import tempfile
+import time
+from urllib.parse import urlsplit, parse_qs, urlencode
 import httpx
 from httpx import RequestError
 
-@dataclass
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+class JsonCodec:
+    name = 'json'
+
+    def loads(self, data: bytes) -> Any:
+        return json.loads(data)
+
+    def dumps(self, obj: Any, indent: bool = False) -> str:
+        if indent:
+            return json.dumps(obj, indent=2)
+        return json.dumps(obj, separators=(',', ':'))
+
+class OrjsonCodec(JsonCodec):
+    name = 'orjson'
+
+    # orjson writes non-ASCII text and DEL as raw bytes, NaN as null,
+    # exponents as 1e-5 and floats in [1e-5, 1e-4) as 0.00005, where the
+    # stdlib writes \u escapes, NaN, 1e-05 and 5e-05. Documents that may
+    # contain any of these are re-encoded with the stdlib so the output
+    # stays byte-compatible; the pattern errs on the side of falling back.
+    _STDLIB_ONLY = re.compile(rb'\de-?\d|null|0\.0000\d|\x7f')
+
+    def loads(self, data: bytes) -> Any:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            # NaN/Infinity literals are accepted by the stdlib only
+            return super().loads(data)
+
+    def dumps(self, obj: Any, indent: bool = False) -> str:
+        try:
+            encoded = orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+        except orjson.JSONEncodeError:
+            return super().dumps(obj, indent)
+        if not encoded.isascii() or self._STDLIB_ONLY.search(encoded):
+            return super().dumps(obj, indent)
+        return encoded.decode('ascii')
+
+CODECS = {cls.name: cls for cls in (JsonCodec, OrjsonCodec)}
+
+def select_codec(name: Optional[str] = None) -> JsonCodec:
+    """Pick the JSON backend used for supplier payloads and output.
+
+    Defaults to orjson when it is installed and the stdlib otherwise.
+    """
+    global codec
+    if name is None:
+        name = 'orjson' if orjson is not None else 'json'
+    if name == 'orjson' and orjson is None:
+        raise ValueError("The 'orjson' JSON backend is not installed")
+    codec = CODECS[name]()
+    return codec
+
+codec = select_codec()
+
+@dataclass(slots=True)
 class Location:
     lat: float = 0.0
     lng: float = 0.0
@@ -24,7 +103,15 @@ class Location:
             ('country', self.country)
         ])
 
-@dataclass
+def canonical_link(link: str) -> str:
+    """Key for image de-duplication: host and path without scheme, default port or fragment"""
+    parts = urlsplit(link.strip())
+    host = parts.hostname or ''
+    if parts.port and parts.port not in (80, 443):
+        host = f'{host}:{parts.port}'
+    return f"//{host}{parts.path or '/'}" + (f'?{parts.query}' if parts.query else '')
+
+@dataclass(slots=True)
 class Image:
     link: str
     description: str
@@ -35,18 +122,64 @@ class Image:
             ('description', self.description)
         ])
 
-@dataclass
+    def rank(self) -> Tuple[int, str, str]:
+        """Between images of the same canonical link, the longest description wins"""
+        return (len(self.description.strip()), self.description, self.link)
+
+@dataclass(slots=True)
 class Amenities:
     general: List[str] = field(default_factory=list)
     room: List[str] = field(default_factory=list)
 
+    def __post_init__(self):
+        # Kept sorted and unique so serialization is a plain copy
+        self.general = sorted(set(self.general))
+        self.room = sorted(set(self.room))
+
     def to_dict(self) -> Dict:
         return OrderedDict([
-            ('general', sorted(list(set(self.general)))),
-            ('room', sorted(list(set(self.room))))
+            ('general', list(self.general)),
+            ('room', list(self.room))
         ])
 
-@dataclass
+# Spellings that still differ from the canonical term after case and
+# word-boundary normalization
+AMENITY_SYNONYMS: Dict[str, str] = {
+    'wi fi': 'wifi',
+    'air con': 'aircon',
+    'air conditioning': 'aircon',
+    'television': 'tv',
+    'tub': 'bathtub',
+    'bath tub': 'bathtub',
+    'hairdryer': 'hair dryer',
+    'mini bar': 'minibar',
+    'coffee maker': 'coffee machine'
+}
+
+AMENITY_CATEGORIES: Dict[str, str] = {
+    **dict.fromkeys(['aircon', 'tv', 'coffee machine', 'kettle', 'hair dryer', 'iron',
+                     'minibar', 'bathtub'], 'room'),
+    **dict.fromkeys(['pool', 'outdoor pool', 'indoor pool', 'business center', 'childcare',
+                     'wifi', 'dry cleaning', 'breakfast', 'bar', 'parking', 'concierge'], 'general')
+}
+
+AMENITY_CACHE_SIZE = 4096
+
+@lru_cache(maxsize=AMENITY_CACHE_SIZE)
+def canonical_amenity(raw: str) -> Tuple[str, Optional[str]]:
+    """Canonical name and category of a raw amenity string.
+
+    'BusinessCenter', 'business center' and ' Business  Center' all map to
+    'business center'. The category is None for terms outside the known
+    vocabulary. Results are memoized in a bounded LRU table, so each distinct
+    spelling is normalized once.
+    """
+    text = re.sub(r'(?<=[a-z])(?=[A-Z])', ' ', raw)
+    text = ' '.join(re.split(r'[\s_-]+', text.strip().lower())).strip()
+    text = AMENITY_SYNONYMS.get(text, text)
+    return text, AMENITY_CATEGORIES.get(text)
+
+@dataclass(slots=True)
 class Images:
     rooms: List[Image] = field(default_factory=list)
     site: List[Image] = field(default_factory=list)
@@ -59,7 +192,54 @@ class Images:
             ('amenities', [img.to_dict() for img in self.amenities])
         ])
 
-@dataclass
+    def merge(self, other: 'Images') -> bool:
+        """Add other's images, keeping one image per canonical link.
+
+        Each list is kept sorted by canonical link. The merge builds a
+        parallel list of those links, so an incoming image is looked up and
+        inserted with a binary search; the links are dropped afterwards
+        rather than held by every hotel in the catalog. The result does not
+        depend on merge order.
+        """
+        changed = False
+        for category in ('rooms', 'site', 'amenities'):
+            keys, reordered = self._reindex(category)
+            images = getattr(self, category)
+            changed = changed or reordered
+
+            for image in getattr(other, category):
+                key = canonical_link(image.link)
+                position = bisect_left(keys, key)
+                if position < len(keys) and keys[position] == key:
+                    if image.rank() > images[position].rank():
+                        images[position] = image
+                        changed = True
+                else:
+                    keys.insert(position, key)
+                    images.insert(position, image)
+                    changed = True
+        return changed
+
+    def _reindex(self, category: str) -> Tuple[List[str], bool]:
+        """Sort and de-duplicate one list by canonical link; returns the links
+        and whether the list changed"""
+        best: Dict[str, Image] = {}
+        for image in getattr(self, category):
+            key = canonical_link(image.link)
+            if key not in best or image.rank() > best[key].rank():
+                best[key] = image
+        keys = sorted(best)
+        deduplicated = [best[key] for key in keys]
+        changed = deduplicated != getattr(self, category)
+        setattr(self, category, deduplicated)
+        return keys, changed
+
+    def normalize(self) -> None:
+        """Sort and de-duplicate the lists by canonical link, as merging does"""
+        for category in ('rooms', 'site', 'amenities'):
+            self._reindex(category)
+
+@dataclass(slots=True)
 class Hotel:
     id: str
     destination_id: str
@@ -69,6 +249,11 @@ class Hotel:
     amenities: Amenities = field(default_factory=Amenities)
     images: Images = field(default_factory=Images)
     booking_conditions: List[str] = field(default_factory=list)
+    source: str = ""
+    # Supplier each MERGE_FIELDS entry's value came from, in that order;
+    # empty until the hotel is merged, when they all come from source
+    sources: Tuple[str, ...] = ()
+    _encoded: Optional[Dict[str, str]] = field(default=None, init=False, repr=False, compare=False)
 
     def to_dict(self) -> Dict:
         return OrderedDict([
@@ -82,41 +267,1359 @@ class Hotel:
             ('booking_conditions', self.booking_conditions)
         ])
 
-    def merge(self, other: 'Hotel') -> None:
-        """Merge data from another hotel"""
-        if len(other.description) > len(self.description):
-            self.description = other.description
-        
-        self.amenities.general.extend(other.amenities.general)
-        self.amenities.room.extend(other.amenities.room)
-        
-        self.images.rooms.extend(other.images.rooms)
-        self.images.site.extend(other.images.site)
-        self.images.amenities.extend(other.images.amenities)
-        
-        self.booking_conditions.extend(other.booking_conditions)
+    def merge(self, other: 'Hotel') -> bool:
+        """Merge data from another hotel, returning whether anything changed"""
+        changed = DEFAULT_MERGE_POLICY.merge(self, other)
+        if changed:
+            self.invalidate()
+        return changed
+
+    def encoded(self, fmt: str = 'pretty') -> str:
+        """Serialized form of this hotel, cached until a merge changes it"""
+        if self._encoded is None:
+            self._encoded = {}
+        text = self._encoded.get(fmt)
+        if text is None:
+            text = self._encoded[fmt] = encode_hotel(self, fmt)
+        return text
+
+    def invalidate(self) -> None:
+        """Drop cached serializations; call after mutating fields directly"""
+        self._encoded = None
+
+# Scalar fields resolved by precedence, mapped to the attributes they cover.
+# Coordinates are one field so lat and lng always come from the same record.
+MERGE_FIELDS: Dict[str, Tuple[str, ...]] = OrderedDict([
+    ('destination_id', ('destination_id',)),
+    ('name', ('name',)),
+    ('coordinates', ('location.lat', 'location.lng')),
+    ('address', ('location.address',)),
+    ('city', ('location.city',)),
+    ('country', ('location.country',)),
+    ('description', ('description',)),
+    ('booking_conditions', ('booking_conditions',))
+])
+
+DEFAULT_PRECEDENCE: Dict[str, List[str]] = {
+    'destination_id': ['acme', 'paperflies', 'patagonia'],
+    'name': ['paperflies', 'acme', 'patagonia'],
+    'coordinates': ['acme', 'patagonia'],
+    'address': ['paperflies', 'patagonia', 'acme'],
+    'city': ['acme', 'paperflies'],
+    'country': ['paperflies', 'acme'],
+    'description': ['paperflies', 'patagonia', 'acme'],
+    'booking_conditions': ['paperflies']
+}
+
+DEFAULT_SCORES: Dict[str, Callable[[Tuple], Any]] = {
+    'description': lambda value: len(value[0].strip())
+}
+
+def _read_attr(obj: Any, path: str) -> Any:
+    for name in path.split('.'):
+        obj = getattr(obj, name)
+    return obj
+
+def _write_attr(obj: Any, path: str, value: Any) -> None:
+    parent, _, name = path.rpartition('.')
+    setattr(_read_attr(obj, parent) if parent else obj, name, value)
+
+@dataclass
+class MergePolicy:
+    """Per-field rules for combining records of the same hotel.
+
+    Each scalar field keeps the candidate with the highest rank: present
+    values beat empty ones, then the field's score, then supplier precedence,
+    with the value and supplier name as final tie-breakers. Amenities are
+    merged as sorted unions and images are de-duplicated by canonical link
+    (see Images.merge). All of these are associative and commutative, so any
+    merge order or grouping produces the same hotel.
+    """
+    precedence: Dict[str, List[str]] = field(default_factory=lambda: dict(DEFAULT_PRECEDENCE))
+    scores: Dict[str, Callable[[Tuple], Any]] = field(default_factory=lambda: dict(DEFAULT_SCORES))
+
+    def rank(self, name: str, value: Tuple, source: str) -> Tuple:
+        order = self.precedence.get(name, [])
+        supplier_rank = len(order) - order.index(source) if source in order else 0
+        score = self.scores[name](value) if name in self.scores else 0
+        return (any(value), score, supplier_rank, value, source)
+
+    def merge(self, target: Hotel, other: Hotel) -> bool:
+        changed = False
+        sources = []
+        for index, (name, paths) in enumerate(MERGE_FIELDS.items()):
+            mine = tuple(_read_attr(target, path) for path in paths)
+            theirs = tuple(_read_attr(other, path) for path in paths)
+            mine_source = target.sources[index] if target.sources else target.source
+            theirs_source = other.sources[index] if other.sources else other.source
+            if self.rank(name, theirs, theirs_source) > self.rank(name, mine, mine_source):
+                for path, value in zip(paths, theirs):
+                    _write_attr(target, path, value)
+                changed = changed or theirs != mine
+                mine_source = theirs_source
+            sources.append(mine_source)
+        target.sources = tuple(sources)
+
+        for attr in ('general', 'room'):
+            mine = getattr(target.amenities, attr)
+            merged = sorted(set(mine) | set(getattr(other.amenities, attr)))
+            if merged != mine:
+                setattr(target.amenities, attr, merged)
+                changed = True
+
+        return target.images.merge(other.images) or changed
+
+DEFAULT_MERGE_POLICY = MergePolicy()
+
+@dataclass
+class CachedResponse:
+    url: str
+    content: bytes
+    fetched_at: float
+    validators: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.fetched_at
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'hotel-suppliers')
+
+class ResponseCache:
+    """Raw supplier responses on disk, keyed by URL.
+
+    On a cold start, entries younger than ttl are used without contacting the
+    supplier. Entries up to stale_ttl older than that are used immediately
+    while a background request refreshes them (stale-while-revalidate). Any
+    entry, however old, is used when the supplier fails, and offline mode
+    serves from the cache only.
+    """
+
+    def __init__(self, directory: str = DEFAULT_CACHE_DIR, ttl: float = 300.0,
+                 stale_ttl: float = 86400.0, offline: bool = False):
+        self.directory = directory
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.offline = offline
+        self._revalidations: set = set()
+
+    def path(self, url: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(url.encode('utf-8')).hexdigest())
+
+    def get(self, url: str, content: bool = True) -> Optional[CachedResponse]:
+        """Read an entry; with content=False only its metadata is loaded"""
+        try:
+            with open(self.path(url), 'rb') as f:
+                header = json.loads(f.readline())
+                body = f.read() if content else b''
+        except (OSError, ValueError):
+            return None
+        if header.get('url') != url:
+            return None
+        return CachedResponse(url, body, header['fetched_at'], header.get('validators', {}))
+
+    def read_chunks(self, url: str, chunk_size: int = 65536) -> Iterator[bytes]:
+        with open(self.path(url), 'rb') as f:
+            f.readline()
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+    def writer(self, url: str, validators: Dict[str, str]) -> 'CacheWriter':
+        return CacheWriter(self, url, validators)
+
+    def put(self, url: str, content: bytes, validators: Dict[str, str]) -> None:
+        writer = self.writer(url, validators)
+        writer.write(content)
+        writer.commit()
+
+    def touch(self, url: str) -> None:
+        """Mark an entry as fresh after the supplier confirmed it is unchanged"""
+        cached = self.get(url, content=False)
+        if cached is None:
+            return
+        writer = self.writer(url, cached.validators)
+        try:
+            for chunk in self.read_chunks(url):
+                writer.write(chunk)
+        except OSError:
+            writer.discard()
+            return
+        writer.commit()
+
+    def revalidate(self, url: str, refresh: Any) -> None:
+        task = asyncio.ensure_future(refresh)
+        self._revalidations.add(task)
+        task.add_done_callback(self._revalidations.discard)
+
+    async def drain(self) -> None:
+        """Wait for background revalidations still in flight"""
+        if self._revalidations:
+            await asyncio.gather(*self._revalidations, return_exceptions=True)
+
+class CacheWriter:
+    """Writes one cache entry through a temporary file that replaces the
+    entry on commit, so readers never see a partial response. Write errors
+    are reported once and turn the writer into a no-op."""
+
+    def __init__(self, cache: ResponseCache, url: str, validators: Dict[str, str]):
+        self.url = url
+        self.path = cache.path(url)
+        self.tmp_path: Optional[str] = None
+        self.file = None
+        header = json.dumps({'url': url, 'fetched_at': time.time(), 'validators': validators})
+        try:
+            os.makedirs(cache.directory, exist_ok=True)
+            fd, self.tmp_path = tempfile.mkstemp(dir=cache.directory, prefix='.tmp-')
+            self.file = os.fdopen(fd, 'wb')
+            self.file.write(header.encode('utf-8') + b'\n')
+        except OSError as e:
+            self._fail(e)
+
+    def write(self, chunk: bytes) -> None:
+        if self.file is None:
+            return
+        try:
+            self.file.write(chunk)
+        except OSError as e:
+            self._fail(e)
+
+    def commit(self) -> None:
+        if self.file is None:
+            return
+        try:
+            self.file.close()
+            os.replace(self.tmp_path, self.path)
+        except OSError as e:
+            self._fail(e)
+        self.file = None
+
+    def discard(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        if self.tmp_path is not None:
+            with contextlib.suppress(OSError):
+                os.unlink(self.tmp_path)
+
+    def _fail(self, error: OSError) -> None:
+        print(f"Error writing cache entry for {self.url}: {str(error)}")
+        self.discard()
+
+class JsonArrayStream:
+    """Splits a top-level JSON array into its elements as bytes arrive.
+
+    Only the bytes of the element currently being received are buffered, and
+    each complete element is decoded on its own, so memory is bounded by the
+    largest element rather than the whole payload. With decode=False the
+    elements are returned as their raw JSON bytes instead.
+    """
+    # A whole string is skipped in one match; "close" is unset when the
+    # string runs past the end of the buffer (or stops at a split escape)
+    _STRING_BODY = rb'[^"\\]*(?:\\.[^"\\]*)*(?P<close>")?'
+    _STRUCTURE = re.compile(rb'"' + _STRING_BODY + rb'|[\[\]{},]', re.DOTALL)
+    _STRING = re.compile(_STRING_BODY, re.DOTALL)
+    # Inside an element only brackets matter: skip up to the next one
+    _NESTED = re.compile(rb'[^"\[\]{}]*(?:"[^"\\]*(?:\\.[^"\\]*)*"[^"\[\]{}]*)*', re.DOTALL)
+
+    def __init__(self, decode: bool = True):
+        self.decode = decode
+        self.buffer = bytearray()
+        self.pos = 0
+        self.start = 0
+        self.depth = 0
+        self.in_string = False
+        self.finished = False
+        self.count = 0
+
+    def feed(self, chunk: bytes) -> List[Any]:
+        if self.finished:
+            return []
+        buffer = self.buffer
+        buffer += chunk
+        elements = []
+        pos = self.pos
+        while True:
+            if self.in_string:
+                match = self._STRING.match(buffer, pos)
+                pos = match.end()
+                if match.group('close') is None:
+                    # Resume here, at a backslash whose escape is split
+                    # across chunks or at the end of the buffer
+                    break
+                self.in_string = False
+                continue
+
+            if self.depth > 1:
+                pos = self._NESTED.match(buffer, pos).end()
+            match = self._STRUCTURE.search(buffer, pos)
+            if match is None:
+                pos = len(buffer)
+                break
+            char = buffer[match.start()]
+            pos = match.end()
+            if char == 0x22:
+                self.in_string = match.group('close') is None
+            elif char in b'[{':
+                if self.depth == 0:
+                    if char != 0x5b or buffer[:match.start()].strip():
+                        raise ValueError("Expected a JSON array")
+                    self.start = pos
+                self.depth += 1
+            elif char in b']}':
+                self.depth -= 1
+                if self.depth == 0:
+                    self._emit(buffer[self.start:match.start()], elements, last=True)
+                    self.finished = True
+                    break
+            elif self.depth == 1:
+                self._emit(buffer[self.start:match.start()], elements)
+                self.start = pos
+
+        # Drop everything before the element in progress
+        if self.depth > 0 and self.start:
+            del buffer[:self.start]
+            pos -= self.start
+            self.start = 0
+        self.pos = pos
+        return elements
+
+    def close(self) -> None:
+        if not self.finished:
+            raise ValueError("Truncated JSON array")
+
+    def _emit(self, raw: bytes, elements: List[Any], last: bool = False) -> None:
+        raw = bytes(raw).strip()
+        if raw:
+            elements.append(codec.loads(raw) if self.decode else raw)
+            self.count += 1
+        elif not last or self.count:
+            raise ValueError("Empty element in JSON array")
+
+T = TypeVar('T')
+
+class CircuitOpenError(Exception):
+    pass
+
+@dataclass
+class BreakerConfig:
+    failure_threshold: int = 5
+    recovery_timeout: float = 30.0
+
+class CircuitBreaker:
+    """Closed / open / half-open circuit breaker guarding one supplier.
+
+    failure_threshold consecutive failed attempts, retries included, open
+    the circuit, and requests are then rejected without touching the
+    network. Once recovery_timeout has passed, a single probe attempt is
+    let through (half-open): success closes the circuit, failure opens it
+    again.
+    State transitions and rejections are counted for metrics.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, config: Optional[BreakerConfig] = None):
+        self.config = config or BreakerConfig()
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.rejected = 0
+        self.transitions: Dict[Tuple[str, str], int] = {}
+
+    def allow(self) -> bool:
+        if self.state == self.OPEN:
+            if time.time() - self.opened_at < self.config.recovery_timeout:
+                self.rejected += 1
+                return False
+            self._transition(self.HALF_OPEN)
+        if self.state == self.HALF_OPEN:
+            if self.probing:
+                self.rejected += 1
+                return False
+            self.probing = True
+        return True
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.probing = False
+        if self.state != self.CLOSED:
+            self._transition(self.CLOSED)
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self.probing = False
+        if self.state == self.HALF_OPEN or self.failures >= self.config.failure_threshold:
+            self.opened_at = time.time()
+            if self.state != self.OPEN:
+                self._transition(self.OPEN)
+
+    def cancel_probe(self) -> None:
+        """The request was cancelled before it could tell anything"""
+        self.probing = False
+
+    def _transition(self, state: str) -> None:
+        key = (self.state, state)
+        self.transitions[key] = self.transitions.get(key, 0) + 1
+        self.state = state
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {'state': self.state, 'failures': self.failures, 'opened_at': self.opened_at}
+
+    def restore(self, snapshot: Dict[str, Any]) -> None:
+        self.state = snapshot.get('state', self.CLOSED)
+        self.failures = snapshot.get('failures', 0)
+        self.opened_at = snapshot.get('opened_at', 0.0)
+
+@dataclass
+class RetryPolicy:
+    """Retries for transient supplier failures.
+
+    Transport errors (connect failures, timeouts) and responses whose status
+    is in retry_statuses are retried up to max_attempts in total, sleeping a
+    random "full jitter" delay between 0 and backoff * 2**(attempt - 1),
+    capped at max_backoff.
+    """
+    max_attempts: int = 3
+    backoff: float = 0.2
+    max_backoff: float = 2.0
+    retry_statuses: FrozenSet[int] = frozenset({429, 500, 502, 503, 504})
+
+    def retryable(self, error: Exception) -> bool:
+        if isinstance(error, httpx.HTTPStatusError):
+            return error.response.status_code in self.retry_statuses
+        return isinstance(error, RequestError)
+
+    def delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+
+    async def call(self, request: Callable[[], Awaitable[T]]) -> T:
+        attempt = 1
+        while True:
+            try:
+                return await request()
+            except Exception as e:
+                if attempt >= self.max_attempts or not self.retryable(e):
+                    raise
+                await asyncio.sleep(self.delay(attempt))
+                attempt += 1
+
+@dataclass
+class HedgePolicy:
+    """Duplicate a supplier request that is slower than usual.
+
+    Once min_samples latencies have been seen, a request still unanswered
+    after the given percentile of the last window latencies is sent a second
+    time and the first response wins. Hedges are capped at budget times the
+    number of requests, so they cannot double the load on a supplier.
+    """
+    percentile: float = 0.95
+    budget: float = 0.1
+    min_samples: int = 20
+    window: int = 200
+
+    def __post_init__(self):
+        if not 0.0 < self.percentile <= 1.0:
+            raise ValueError(f"Invalid hedge percentile {self.percentile}, expected a number in (0, 1]")
+
+class Hedger:
+    def __init__(self, policy: HedgePolicy):
+        self.policy = policy
+        self.latencies: deque = deque(maxlen=policy.window)
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def hedge_delay(self) -> Optional[float]:
+        if len(self.latencies) < self.policy.min_samples:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(self.policy.percentile * len(ordered)))]
+
+    def snapshot(self) -> List[float]:
+        return list(self.latencies)
+
+    def restore(self, latencies: List[float]) -> None:
+        self.latencies.extend(latencies)
+
+    async def call(self, request: Callable[[], Awaitable[T]],
+                   discard: Optional[Callable[[T], Awaitable[None]]] = None) -> T:
+        """Run request, hedged once it is slow; discard releases what a request
+        that also succeeded but lost returned, such as an open stream"""
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        self.requests += 1
+        delay = self.hedge_delay()
+        primary = asyncio.ensure_future(request())
+        pending = {primary}
+        try:
+            if delay is not None and self.hedges + 1 <= self.policy.budget * self.requests:
+                done, _ = await asyncio.wait(pending, timeout=delay)
+                if not done:
+                    self.hedges += 1
+                    pending.add(asyncio.ensure_future(request()))
+
+            error: Optional[BaseException] = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                succeeded = [task for task in done if task.exception() is None]
+                if succeeded:
+                    self.latencies.append(loop.time() - start)
+                    self.hedge_wins += succeeded[0] is not primary
+                    for task in pending:
+                        task.cancel()
+                    if discard is not None:
+                        for task in succeeded[1:]:
+                            await discard(task.result())
+                    return succeeded[0].result()
+                for task in done:
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+@dataclass
+class RateLimit:
+    """Client-side request budget of a supplier.
+
+    Requests are spent from a token bucket refilled at rate per second and
+    holding at most burst tokens, and at most max_in_flight requests are
+    outstanding at once. A 429 (or a 503 with Retry-After) halves the rate,
+    down to min_rate, and pauses the bucket for Retry-After seconds (capped
+    at max_pause); each success then restores recovery times the configured
+    rate.
+    """
+    rate: float = 10.0
+    burst: int = 10
+    max_in_flight: int = 4
+    min_rate: float = 0.5
+    recovery: float = 0.1
+    max_pause: float = 60.0
+
+class RateLimiter:
+    def __init__(self, limit: RateLimit):
+        self.limit = limit
+        self.rate = limit.rate
+        self.tokens = float(limit.burst)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.throttled = 0
+        self.in_flight = asyncio.Semaphore(limit.max_in_flight)
+
+    async def acquire(self) -> None:
+        """Wait for an in-flight slot and a token"""
+        await self.in_flight.acquire()
+        try:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.limit.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+        except BaseException:
+            self.in_flight.release()
+            raise
+
+    def release(self) -> None:
+        self.in_flight.release()
+
+    @contextlib.asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def observe(self, response: httpx.Response) -> None:
+        """Adapt the rate to a supplier response"""
+        retry_after = self.retry_after(response)
+        if response.status_code == 429 or (response.status_code == 503 and retry_after is not None):
+            self.throttled += 1
+            self.rate = max(self.limit.min_rate, self.rate / 2)
+            self.tokens = min(self.tokens, 0.0)
+            if retry_after:
+                self.paused_until = max(self.paused_until,
+                                        time.monotonic() + min(retry_after, self.limit.max_pause))
+        elif response.status_code < 400:
+            self.rate = min(self.limit.rate, self.rate + self.limit.recovery * self.limit.rate)
+
+    @staticmethod
+    def retry_after(response: httpx.Response) -> Optional[float]:
+        """Retry-After in seconds, given either as seconds or as an HTTP date"""
+        value = (response.headers.get('Retry-After') or '').strip()
+        if not value:
+            return None
+        if value.isdigit():
+            return float(value)
+        try:
+            return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+@dataclass
+class ClientConfig:
+    max_connections: int = 20
+    max_keepalive_connections: int = 10
+    keepalive_expiry: float = 30.0
+    http2: bool = False
+    timeout: float = 10.0
+
+    def build(self) -> httpx.AsyncClient:
+        limits = httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry
+        )
+        try:
+            return httpx.AsyncClient(limits=limits, timeout=self.timeout, http2=self.http2)
+        except ImportError:
+            # http2=True needs the optional 'h2' package
+            print("HTTP/2 is not available (install httpx[http2]), falling back to HTTP/1.1")
+            return httpx.AsyncClient(limits=limits, timeout=self.timeout)
+
+@dataclass
+class Pagination:
+    """How a supplier pages through its catalog.
+
+    strategy is 'page' (page numbers counted from first_page), 'offset'
+    (record offsets) or 'cursor' (each page names the next one under
+    cursor_key). Page and offset requests do not depend on each other, so
+    up to concurrency of them are in flight at once, and a page shorter than
+    page_size ends the catalog. Cursor pages are sequential, but the next
+    page is requested before the current one is parsed. A page body is
+    either a bare array or an object holding the records under items_key.
+    """
+    strategy: str = 'page'
+    page_size: int = 100
+    concurrency: int = 4
+    items_key: Optional[str] = None
+    cursor_key: str = 'next_cursor'
+    page_param: str = 'page'
+    size_param: str = 'limit'
+    offset_param: str = 'offset'
+    cursor_param: str = 'cursor'
+    first_page: int = 1
+    max_pages: int = 10000
+
+    def __post_init__(self):
+        if self.strategy not in ('page', 'offset', 'cursor'):
+            raise ValueError(f"Unknown pagination strategy: {self.strategy}")
+
+    def params(self, index: int, cursor: Optional[str] = None) -> Dict[str, Any]:
+        """Query parameters of the index-th page"""
+        params: Dict[str, Any] = {self.size_param: self.page_size}
+        if self.strategy == 'page':
+            params[self.page_param] = self.first_page + index
+        elif self.strategy == 'offset':
+            params[self.offset_param] = index * self.page_size
+        elif cursor:
+            params[self.cursor_param] = cursor
+        return params
+
+class HotelQuery:
+    """A hotel id filter, pushed down into supplier parsing.
+
+    Only the ids are pushed down: suppliers may disagree on a hotel's
+    destination, so the destination filter is applied to the merged hotels.
+    """
+
+    def __init__(self, hotel_ids: List[str]):
+        self.hotel_ids = set(hotel_ids)
+
+    def matches(self, hotel_id: str) -> bool:
+        return hotel_id in self.hotel_ids
+
+    @classmethod
+    def build(cls, hotel_ids: Optional[List[str]] = None) -> Optional['HotelQuery']:
+        """The query for these ids, or None when nothing is filtered"""
+        if not hotel_ids:
+            return None
+        return cls(hotel_ids)
+
+# A hotel as nested tuples of plain values, which pickle far smaller and
+# faster than the dataclasses when parsed hotels leave a worker process
+HotelRow = Tuple[Any, ...]
+
+def hotel_to_row(hotel: Hotel) -> HotelRow:
+    location, images = hotel.location, hotel.images
+    return (
+        hotel.id, hotel.destination_id, hotel.name,
+        (location.lat, location.lng, location.address, location.city, location.country),
+        hotel.description, tuple(hotel.amenities.general), tuple(hotel.amenities.room),
+        tuple((image.link, image.description) for image in images.rooms),
+        tuple((image.link, image.description) for image in images.site),
+        tuple((image.link, image.description) for image in images.amenities),
+        tuple(hotel.booking_conditions), hotel.source, hotel.sources
+    )
+
+def hotel_from_row(row: HotelRow) -> Hotel:
+    (hotel_id, destination_id, name, location, description, general, room,
+     rooms, site, amenities, booking_conditions, source, sources) = row
+    return Hotel(
+        id=hotel_id,
+        destination_id=destination_id,
+        name=name,
+        location=Location(*location),
+        description=description,
+        amenities=Amenities(general=list(general), room=list(room)),
+        images=Images(
+            rooms=[Image(*image) for image in rooms],
+            site=[Image(*image) for image in site],
+            amenities=[Image(*image) for image in amenities]
+        ),
+        booking_conditions=list(booking_conditions),
+        source=source,
+        sources=sources
+    )
+
+# Supplier instances of a worker process, created on first use
+_worker_suppliers: Dict[type, 'BaseSupplier'] = {}
+
+_JSON_DECODER = json.JSONDecoder()
+_JSON_WHITESPACE = re.compile(r'[ \t\n\r]*')
+_ELEMENT_END = re.compile(r'[ \t\n\r]*([,\]])[ \t\n\r]*')
+_ELEMENT_AFTER_COMMA = re.compile(r',[ \t\n\r]*')
+
+def _decode_elements(text: str, position: int, limit: int) -> Tuple[List[Any], int, str]:
+    """Decode the JSON array elements that start at position, where one
+    starts, and before limit.
+
+    Returns the elements, where decoding stopped and why: 'limit' (the next
+    element starts there), 'end' (the array's closing bracket is there) or
+    'error' (the element there does not decode, is cut off by the end of
+    text or is not followed by a comma or the closing bracket).
+    """
+    elements = []
+    raw_decode, element_end = _JSON_DECODER.raw_decode, _ELEMENT_END.match
+    while position < limit:
+        try:
+            element, after = raw_decode(text, position)
+        except ValueError:
+            return elements, position, 'error'
+        separator = element_end(text, after)
+        if separator is None:
+            return elements, position, 'error'
+        elements.append(element)
+        if separator.group(1) == ']':
+            return elements, separator.start(1), 'end'
+        position = separator.end()
+    return elements, position, 'limit'
+
+def _parse_span(supplier_cls: type, window: str, offset: int, start: int, end: int, array_end: int,
+                synced: bool, query: Optional['HotelQuery']) -> Tuple[int, int, str, List[HotelRow], str]:
+    """Worker side: parse the records of a supplier's JSON array that start
+    in [start, end) into hotel rows.
+
+    window is the payload's text from offset on, reaching a little past
+    end. Unless synced (start is where a record starts), the first record is
+    found by decoding from each comma on until records decode up to end or
+    to the closing bracket at array_end. That may still be a comma inside a
+    record, so the caller only takes the span when it starts where the
+    previous one stopped. Returns where the span starts (-1 when no record
+    start was found), where and why decoding stopped (see _decode_elements),
+    the rows and the messages parsing printed, held back until then.
+    """
+    if synced:
+        candidates: Iterable[int] = [start - offset]
+    else:
+        candidates = (match.end() for match in _ELEMENT_AFTER_COMMA.finditer(window)
+                      if match.end() >= start - offset)
+    for position in candidates:
+        elements, stop, reason = _decode_elements(window, position, end - offset)
+        if reason == 'limit' or (reason == 'end' and stop + offset == array_end) or (
+                reason == 'error' and elements):
+            break
+    else:
+        return -1, -1, 'error', [], ''
+    supplier = _worker_suppliers.get(supplier_cls)
+    if supplier is None:
+        supplier = _worker_suppliers[supplier_cls] = supplier_cls()
+    messages = io.StringIO()
+    with contextlib.redirect_stdout(messages):
+        rows = [hotel_to_row(hotel) for hotel in supplier.parse_records(elements, query)]
+    return position + offset, stop + offset, reason, rows, messages.getvalue()
+
+class ParserPool:
+    """Decodes and parses large supplier payloads in worker processes.
+
+    A payload of at least threshold bytes is decoded to text in the parent
+    and cut into spans of chunk_size characters; each worker finds the first
+    record starting in its span and parses the records from there, on a
+    window reaching overhang characters past the span for the last one. The
+    parent checks that every span starts where the previous one stopped and
+    parses any gap itself, so the records are exactly those of parsing the
+    whole payload. Hotels come back as rows (see hotel_to_row) and are
+    rebuilt batch_size at a time, letting the event loop run in between.
+    """
+    # Characters before a span's start searched for the comma ahead of its
+    # first record
+    lookbehind = 64
+
+    def __init__(self, workers: Optional[int] = None, threshold: int = 1 << 20,
+                 batch_size: int = 2000, chunk_size: int = 1 << 20, overhang: int = 1 << 16):
+        self.workers = workers
+        self.threshold = threshold
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+        self.overhang = overhang
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        """Worker processes, started on first use.
+
+        They are started from a fresh process rather than forked from this
+        one, which by then runs the event loop's and httpx's threads.
+        """
+        if self._executor is None:
+            method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context(method))
+        return self._executor
+
+    def wants(self, content: bytes) -> bool:
+        return len(content) >= self.threshold
+
+    async def parse(self, supplier: 'BaseSupplier', url: str, content: bytes,
+                    query: Optional['HotelQuery'] = None) -> List[Hotel]:
+        try:
+            text = content.decode('utf-8')
+        except UnicodeDecodeError:
+            raise ValueError(f"Invalid response format from {url}")
+        opening = _JSON_WHITESPACE.match(text).end()
+        closing = len(text)
+        while closing > opening and text[closing - 1] in ' \t\n\r':
+            closing -= 1
+        if closing - opening < 2 or text[opening] != '[' or text[closing - 1] != ']':
+            raise ValueError(f"Invalid response format from {url}")
+        array_end = closing - 1
+        first = _JSON_WHITESPACE.match(text, opening + 1).end()
+        if first == array_end:
+            return []
+
+        loop = asyncio.get_running_loop()
+        futures = []
+        for start in range(first, array_end, self.chunk_size):
+            end = min(start + self.chunk_size, array_end)
+            offset = max(first, start - self.lookbehind)
+            futures.append(loop.run_in_executor(
+                self.executor, _parse_span, type(supplier), text[offset:min(end + self.overhang, closing)],
+                offset, start, end, array_end, start == first, query))
+
+        hotels: List[Hotel] = []
+        # What parsing printed, shown once the whole array has decoded
+        messages = io.StringIO()
+        position, finished = first, False
+        try:
+            for future in futures:
+                span_start, stop, reason, rows, printed = await future
+                if position < span_start and not finished:
+                    with contextlib.redirect_stdout(messages):
+                        position, finished = self._parse_gap(supplier, url, text, position, span_start,
+                                                             array_end, hotels, query)
+                if position != span_start or finished:
+                    continue
+                messages.write(printed)
+                position, finished = stop, reason == 'end'
+                for index in range(0, len(rows), self.batch_size):
+                    hotels += [hotel_from_row(row) for row in rows[index:index + self.batch_size]]
+                    await asyncio.sleep(0)
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+        if not finished:
+            with contextlib.redirect_stdout(messages):
+                self._parse_gap(supplier, url, text, position, closing, array_end, hotels, query)
+        print(messages.getvalue(), end='')
+        return hotels
+
+    @staticmethod
+    def _parse_gap(supplier: 'BaseSupplier', url: str, text: str, position: int, limit: int,
+                   array_end: int, hotels: List[Hotel], query: Optional['HotelQuery']) -> Tuple[int, bool]:
+        """Parse the records from position that start before limit; returns
+        where the next one starts and whether the array ended"""
+        # A span cut off by the end of its window may stop in the whitespace
+        # ahead of a record
+        position = _JSON_WHITESPACE.match(text, position).end()
+        elements, stop, reason = _decode_elements(text, position, limit)
+        if reason == 'error' or (reason == 'end') != (stop == array_end):
+            raise ValueError(f"Invalid response format from {url}")
+        hotels += supplier.parse_records(elements, query)
+        return stop, reason == 'end'
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
 
 class BaseSupplier:
-    async def fetch(self) -> List[Hotel]:
+    name = ""
+    retry_policy = RetryPolicy()
+    rate_limit = RateLimit()
+    # Set on suppliers that page their catalog instead of returning one array
+    pagination: Optional[Pagination] = None
+    # Key of the raw record's hotel id, used for filter pushdown
+    id_key = ""
+
+    def __init__(self, breaker_config: Optional[BreakerConfig] = None):
+        # ETag / Last-Modified of the last payload loaded from each URL; a URL
+        # is present once its hotels have been handed to the service, which
+        # keeps them while the payload is unchanged (304)
+        self.validators: Dict[str, Dict[str, str]] = {}
+        # Whether the last fetch, stream or pages call loaded a whole payload;
+        # when it did not, the service keeps the records it had
+        self.refreshed = False
+        self.breaker = CircuitBreaker(breaker_config)
+        self.hedger: Optional[Hedger] = None
+        self.limiter = RateLimiter(self.rate_limit)
+        # Set by HotelService to parse large payloads in worker processes
+        self.parser_pool: Optional[ParserPool] = None
+
+    async def fetch(self, client: Optional[httpx.AsyncClient] = None,
+                    cache: Optional[ResponseCache] = None,
+                    query: Optional['HotelQuery'] = None) -> Optional[List[Hotel]]:
+        """Fetch and parse the supplier's hotels.
+
+        Returns None when the hotels loaded by the previous fetch are still
+        current, e.g. the supplier answered 304 Not Modified. With a query,
+        only matching records are parsed (see accepts).
+        """
+        self.refreshed = False
         try:
-            async with httpx.AsyncClient() as client:
-                response = await client.get(self.endpoint(), timeout=10.0)
-                response.raise_for_status()
-                data = response.json()
-                if not isinstance(data, list):
-                    print(f"Invalid response format from {self.endpoint()}")
-                    return []
-                return [hotel for hotel in [self.parse(item) for item in data] if hotel]
+            if client is not None:
+                return await self._fetch_with(client, cache, query)
+            async with ClientConfig().build() as client:
+                return await self._fetch_with(client, cache, query)
         except Exception as e:
             print(f"Error fetching from {self.endpoint()}: {str(e)}")
             return []
 
+    async def _fetch_with(self, client: httpx.AsyncClient, cache: Optional[ResponseCache] = None,
+                          query: Optional['HotelQuery'] = None) -> Optional[List[Hotel]]:
+        if self.pagination is not None:
+            return [hotel async for hotels in self._pages_with(client, cache, query) for hotel in hotels]
+
+        url = self.endpoint()
+        loaded = url in self.validators
+
+        if cache is not None and cache.offline:
+            if loaded:
+                return None
+            cached = cache.get(url)
+            if cached is None:
+                raise LookupError(f"no cached response for {url} in {cache.directory}")
+            return await self.aload(url, cached.content, cached.validators, query)
+
+        # The disk cache only matters until this supplier has loaded its data;
+        # afterwards conditional requests keep the in-memory copy current.
+        cached = cache.get(url) if cache is not None and not loaded else None
+        if cached is not None:
+            if cached.age < cache.ttl:
+                return await self.aload(url, cached.content, cached.validators, query)
+            if cached.age < cache.ttl + cache.stale_ttl:
+                cache.revalidate(url, self._revalidate(client, cache, cached))
+                return await self.aload(url, cached.content, cached.validators, query)
+
+        validators = self.validators.get(url) if loaded else (cached.validators if cached else {})
+        try:
+            response = await self.download(client, url, validators)
+        except Exception as e:
+            if cached is None:
+                raise
+            print(f"Error fetching from {url}: {str(e)}, using cached response from {cached.age:.0f}s ago")
+            return await self.aload(url, cached.content, cached.validators, query)
+
+        if response.status_code == 304:
+            if loaded or cached is None:
+                return None
+            cache.touch(url)
+            return await self.aload(url, cached.content, cached.validators, query)
+
+        validators = self.response_validators(response)
+        hotels = await self.aload(url, response.content, validators, query)
+        if cache is not None:
+            cache.put(url, response.content, validators)
+        return hotels
+
+    async def stream(self, client: httpx.AsyncClient, cache: Optional[ResponseCache] = None,
+                     query: Optional['HotelQuery'] = None) -> AsyncIterator[Hotel]:
+        """Yield hotels while the payload is still arriving.
+
+        Array elements are parsed one at a time as bytes come in, so peak
+        memory is bounded by the largest element instead of the whole
+        payload. Conditional requests and the response cache work as in
+        fetch; nothing is yielded when the hotels loaded last time are still
+        current. Errors are reported like fetch, after the hotels parsed so far.
+        """
+        self.refreshed = False
+        try:
+            async for hotel in self._stream_with(client, cache, query):
+                yield hotel
+        except Exception as e:
+            print(f"Error fetching from {self.endpoint()}: {str(e)}")
+
+    async def _stream_with(self, client: httpx.AsyncClient, cache: Optional[ResponseCache] = None,
+                           query: Optional['HotelQuery'] = None) -> AsyncIterator[Hotel]:
+        if self.pagination is not None:
+            async for hotels in self._pages_with(client, cache, query):
+                for hotel in hotels:
+                    yield hotel
+            return
+
+        url = self.endpoint()
+        loaded = url in self.validators
+
+        if cache is not None and cache.offline:
+            if loaded:
+                return
+            cached = cache.get(url, content=False)
+            if cached is None:
+                raise LookupError(f"no cached response for {url} in {cache.directory}")
+            async for hotel in self.load_stream(url, self.cached_chunks(cache, url), cached.validators,
+                                                query=query):
+                yield hotel
+            return
+
+        cached = cache.get(url, content=False) if cache is not None and not loaded else None
+        if cached is not None and cached.age < cache.ttl + cache.stale_ttl:
+            if cached.age >= cache.ttl:
+                cache.revalidate(url, self._revalidate(client, cache, cached))
+            async for hotel in self.load_stream(url, self.cached_chunks(cache, url), cached.validators,
+                                                query=query):
+                yield hotel
+            return
+
+        validators = self.validators.get(url) if loaded else (cached.validators if cached else {})
+        async with contextlib.AsyncExitStack() as stack:
+            try:
+                response = await self.open_stream(stack, client, url, validators)
+            except Exception as e:
+                if cached is None:
+                    raise
+                print(f"Error fetching from {url}: {str(e)}, using cached response from {cached.age:.0f}s ago")
+                response = None
+
+            if response is None or response.status_code == 304:
+                if loaded or cached is None:
+                    return
+                if response is not None:
+                    cache.touch(url)
+                async for hotel in self.load_stream(url, self.cached_chunks(cache, url), cached.validators,
+                                                query=query):
+                    yield hotel
+                return
+
+            validators = self.response_validators(response)
+            writer = cache.writer(url, validators) if cache is not None else None
+            async for hotel in self.load_stream(url, response.aiter_bytes(), validators, writer, query):
+                yield hotel
+
+    async def load_stream(self, url: str, chunks: AsyncIterator[bytes], validators: Dict[str, str],
+                          writer: Optional[CacheWriter] = None,
+                          query: Optional['HotelQuery'] = None) -> AsyncIterator[Hotel]:
+        """Parse hotels from payload chunks, copying them to writer if given"""
+        parser = JsonArrayStream()
+        try:
+            async for chunk in chunks:
+                if writer is not None:
+                    writer.write(chunk)
+                for item in parser.feed(chunk):
+                    if not self.accepts(item, query):
+                        continue
+                    hotel = self.parse(item)
+                    if hotel:
+                        yield hotel
+            parser.close()
+        except BaseException:
+            if writer is not None:
+                writer.discard()
+            raise
+        if writer is not None:
+            writer.commit()
+        self.loaded(url, validators, query)
+
+    async def pages(self, client: httpx.AsyncClient, cache: Optional[ResponseCache] = None,
+                    query: Optional['HotelQuery'] = None) -> AsyncIterator[List[Hotel]]:
+        """Yield the hotels of each page of a paginated supplier, in page order.
+
+        At most pagination.concurrency pages are fetched ahead of the page
+        being consumed, so memory stays bounded however large the catalog.
+        Errors are reported like fetch, after the pages parsed so far.
+        """
+        self.refreshed = False
+        try:
+            async for hotels in self._pages_with(client, cache, query):
+                yield hotels
+        except Exception as e:
+            print(f"Error fetching from {self.endpoint()}: {str(e)}")
+
+    async def _pages_with(self, client: httpx.AsyncClient, cache: Optional[ResponseCache] = None,
+                          query: Optional['HotelQuery'] = None) -> AsyncIterator[List[Hotel]]:
+        async with contextlib.aclosing(self._page_batches(client, cache, query)) as batches:
+            async for hotels in batches:
+                yield hotels
+        # Pages carry no validators, so every refresh reads all of them
+        self.refreshed = True
+
+    async def _page_batches(self, client: httpx.AsyncClient, cache: Optional[ResponseCache] = None,
+                            query: Optional['HotelQuery'] = None) -> AsyncIterator[List[Hotel]]:
+        pagination = self.pagination
+        if pagination.strategy == 'cursor':
+            index = 0
+            task: Optional[asyncio.Future] = asyncio.ensure_future(
+                self.fetch_page(client, cache, self.page_url(0)))
+            try:
+                while task is not None:
+                    records, cursor = await task
+                    index += 1
+                    task = None
+                    if cursor and records and index < pagination.max_pages:
+                        task = asyncio.ensure_future(self.fetch_page(client, cache, self.page_url(index, cursor)))
+                    yield self.parse_records(records, query)
+            finally:
+                if task is not None:
+                    task.cancel()
+            return
+
+        # Pages are requested in a sliding window and consumed in order; a
+        # short page means the pages requested after it are empty.
+        window: deque = deque()
+        index = 0
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and len(window) < pagination.concurrency and index < pagination.max_pages:
+                    window.append(asyncio.ensure_future(self.fetch_page(client, cache, self.page_url(index))))
+                    index += 1
+                if not window:
+                    return
+                records, _ = await window.popleft()
+                if len(records) < pagination.page_size:
+                    exhausted = True
+                    while window:
+                        window.popleft().cancel()
+                yield self.parse_records(records, query)
+        finally:
+            for task in window:
+                task.cancel()
+
+    def page_url(self, index: int, cursor: Optional[str] = None) -> str:
+        url = self.endpoint()
+        return url + ('&' if '?' in url else '?') + urlencode(self.pagination.params(index, cursor))
+
+    async def fetch_page(self, client: httpx.AsyncClient, cache: Optional[ResponseCache],
+                         url: str) -> Tuple[List[Any], Optional[str]]:
+        """Records and next cursor of one page, from the cache while it is
+        fresh, offline or the supplier is down, otherwise downloaded"""
+        cached = cache.get(url) if cache is not None else None
+        if cache is not None and cache.offline:
+            if cached is None:
+                raise LookupError(f"no cached response for {url} in {cache.directory}")
+            return self.read_page(url, cached.content)
+        if cached is not None and cached.age < cache.ttl:
+            return self.read_page(url, cached.content)
+
+        try:
+            response = await self.download(client, url, cached.validators if cached else {})
+        except Exception as e:
+            if cached is None:
+                raise
+            print(f"Error fetching from {url}: {str(e)}, using cached response from {cached.age:.0f}s ago")
+            return self.read_page(url, cached.content)
+
+        if response.status_code == 304 and cached is not None:
+            cache.touch(url)
+            return self.read_page(url, cached.content)
+        page = self.read_page(url, response.content)
+        if cache is not None:
+            cache.put(url, response.content, self.response_validators(response))
+        return page
+
+    def read_page(self, url: str, content: bytes) -> Tuple[List[Any], Optional[str]]:
+        data = codec.loads(content)
+        items_key = self.pagination.items_key
+        records = data.get(items_key) if items_key and isinstance(data, dict) else data
+        if not isinstance(records, list):
+            raise ValueError(f"Invalid response format from {url}")
+        cursor = data.get(self.pagination.cursor_key) if isinstance(data, dict) else None
+        return records, str(cursor) if cursor else None
+
+    def parse_records(self, records: List[Any], query: Optional['HotelQuery'] = None) -> List[Hotel]:
+        hotels = (self.parse(item) for item in records if self.accepts(item, query))
+        return [hotel for hotel in hotels if hotel]
+
+    @staticmethod
+    async def cached_chunks(cache: ResponseCache, url: str) -> AsyncIterator[bytes]:
+        for chunk in cache.read_chunks(url):
+            yield chunk
+
+    async def _revalidate(self, client: httpx.AsyncClient, cache: ResponseCache,
+                          cached: CachedResponse) -> None:
+        try:
+            response = await self.download(client, cached.url, cached.validators)
+            if response.status_code == 304:
+                cache.touch(cached.url)
+            elif isinstance(codec.loads(response.content), list):
+                cache.put(cached.url, response.content, self.response_validators(response))
+        except Exception as e:
+            print(f"Error revalidating cached response for {cached.url}: {str(e)}")
+
+    async def download(self, client: httpx.AsyncClient, url: str,
+                       validators: Dict[str, str]) -> httpx.Response:
+        """GET url, conditional on validators, retrying transient failures.
+        304 responses are returned as is."""
+        async def send() -> httpx.Response:
+            async with self.limiter.slot():
+                response = await client.get(url, headers=self.conditional_headers(validators))
+            self.limiter.observe(response)
+            return response
+
+        async def attempt() -> httpx.Response:
+            response = await (self.hedger.call(send) if self.hedger is not None else send())
+            if response.status_code != 304:
+                response.raise_for_status()
+            return response
+
+        return await self.guarded(attempt)
+
+    async def guarded(self, attempt: Callable[[], Awaitable[T]]) -> T:
+        """Run a request with retries, each attempt behind the supplier's circuit breaker"""
+        async def breaker_attempt() -> T:
+            if not self.breaker.allow():
+                raise CircuitOpenError(f"circuit open for {self.name}, request skipped")
+            try:
+                result = await attempt()
+            except asyncio.CancelledError:
+                self.breaker.cancel_probe()
+                raise
+            except Exception:
+                self.breaker.record_failure()
+                raise
+            self.breaker.record_success()
+            return result
+
+        return await self.retry_policy.call(breaker_attempt)
+
+    async def open_stream(self, stack: contextlib.AsyncExitStack, client: httpx.AsyncClient, url: str,
+                          validators: Dict[str, str]) -> httpx.Response:
+        """Streaming counterpart of download; the response is closed with stack.
+        Only failures before the body starts are retried, and hedging races
+        the requests up to their response headers."""
+        async def send() -> Tuple[httpx.Response, contextlib.AsyncExitStack]:
+            # The in-flight slot is held until the body has been read
+            opened = contextlib.AsyncExitStack()
+            await self.limiter.acquire()
+            opened.callback(self.limiter.release)
+            try:
+                response = await opened.enter_async_context(
+                    client.stream('GET', url, headers=self.conditional_headers(validators)))
+                self.limiter.observe(response)
+            except BaseException:
+                await opened.aclose()
+                raise
+            return response, opened
+
+        async def close(sent: Tuple[httpx.Response, contextlib.AsyncExitStack]) -> None:
+            await sent[1].aclose()
+
+        async def attempt() -> httpx.Response:
+            response, opened = await (self.hedger.call(send, close) if self.hedger is not None else send())
+            try:
+                if response.status_code != 304:
+                    response.raise_for_status()
+            except BaseException:
+                await opened.aclose()
+                raise
+            stack.push_async_callback(opened.aclose)
+            return response
+
+        return await self.guarded(attempt)
+
+    def load(self, url: str, content: bytes, validators: Dict[str, str],
+             query: Optional['HotelQuery'] = None) -> List[Hotel]:
+        """Parse a payload; a filtered load does not count as the supplier's
+        loaded data, so later fetches do not skip it as unchanged"""
+        data = codec.loads(content)
+        if not isinstance(data, list):
+            raise ValueError(f"Invalid response format from {url}")
+        hotels = self.parse_records(data, query)
+        self.loaded(url, validators, query)
+        return hotels
+
+    async def aload(self, url: str, content: bytes, validators: Dict[str, str],
+                    query: Optional['HotelQuery'] = None) -> List[Hotel]:
+        """load, in the parser pool when the payload is large enough for it"""
+        if self.parser_pool is None or not self.parser_pool.wants(content):
+            return self.load(url, content, validators, query)
+        hotels = await self.parser_pool.parse(self, url, content, query)
+        self.loaded(url, validators, query)
+        return hotels
+
+    def loaded(self, url: str, validators: Dict[str, str], query: Optional['HotelQuery'] = None) -> None:
+        """Note a whole payload as parsed; an unfiltered one becomes the supplier's current data"""
+        self.refreshed = True
+        if query is None:
+            self.validators[url] = validators
+
+    @staticmethod
+    def conditional_headers(validators: Dict[str, str]) -> Dict[str, str]:
+        headers = {}
+        if 'etag' in validators:
+            headers['If-None-Match'] = validators['etag']
+        if 'last_modified' in validators:
+            headers['If-Modified-Since'] = validators['last_modified']
+        return headers
+
+    @staticmethod
+    def response_validators(response: httpx.Response) -> Dict[str, str]:
+        validators = {}
+        if response.headers.get('ETag'):
+            validators['etag'] = response.headers['ETag']
+        if response.headers.get('Last-Modified'):
+            validators['last_modified'] = response.headers['Last-Modified']
+        return validators
+
     def endpoint(self) -> str:
         raise NotImplementedError
 
+    def accepts(self, data: Any, query: Optional['HotelQuery']) -> bool:
+        """Check a raw record against the query before building a Hotel from it"""
+        if query is None:
+            return True
+        try:
+            return query.matches(str(data[self.id_key]))
+        except (KeyError, TypeError, IndexError):
+            return False
+
     def parse(self, data: dict) -> Optional[Hotel]:
         raise NotImplementedError
 
+    @staticmethod
+    def normalize_amenities(general: Any = None, room: Any = None) -> Amenities:
+        """Canonicalize raw amenities, moving known terms to their category"""
+        categories: Dict[str, set] = {'general': set(), 'room': set()}
+        for default, values in (('general', general), ('room', room)):
+            if not isinstance(values, list):
+                continue
+            for raw in values:
+                if not raw:
+                    continue
+                name, category = canonical_amenity(str(raw))
+                if name:
+                    categories[category or default].add(name)
+        return Amenities(general=list(categories['general']), room=list(categories['room']))
+
     @staticmethod
     def safe_float(value: Any) -> float:
         if value is None:
@@ -127,6 +1630,9 @@ class BaseSupplier:
             return 0.0
 
 class AcmeSupplier(BaseSupplier):
+    name = "acme"
+    id_key = "Id"
+
     def endpoint(self) -> str:
         return "https://5f2be0b4ffc88500167b85a0.mockapi.io/suppliers/acme"
 
@@ -144,18 +1650,19 @@ class AcmeSupplier(BaseSupplier):
                     country=str(data.get("Country", ""))
                 ),
                 description=str(data.get("Description", "")),
-                amenities=Amenities(
-                    general=data.get("Facilities", []),
-                    room=[]
-                ),
+                amenities=self.normalize_amenities(general=data.get("Facilities", [])),
                 images=Images(),
-                booking_conditions=[]
+                booking_conditions=[],
+                source=self.name
             )
         except Exception as e:
             print(f"Error parsing ACME data: {e}")
             return None
 
 class PaperfliesSupplier(BaseSupplier):
+    name = "paperflies"
+    id_key = "hotel_id"
+
     def endpoint(self) -> str:
         return "https://5f2be0b4ffc88500167b85a0.mockapi.io/suppliers/paperflies"
 
@@ -175,7 +1682,7 @@ class PaperfliesSupplier(BaseSupplier):
                     country=str(location_data.get("country", ""))
                 ),
                 description=str(data.get("details", "")),
-                amenities=Amenities(
+                amenities=self.normalize_amenities(
                     general=amenities_data.get("general", []),
                     room=amenities_data.get("room", [])
                 ),
@@ -191,13 +1698,17 @@ class PaperfliesSupplier(BaseSupplier):
                         if isinstance(img, dict) and "link" in img and "caption" in img
                     ]
                 ),
-                booking_conditions=data.get("booking_conditions", [])
+                booking_conditions=data.get("booking_conditions", []),
+                source=self.name
             )
         except Exception as e:
             print(f"Error parsing Paperflies data: {e}")
             return None
 
 class PatagoniaSupplier(BaseSupplier):
+    name = "patagonia"
+    id_key = "id"
+
     def endpoint(self) -> str:
         return "https://5f2be0b4ffc88500167b85a0.mockapi.io/suppliers/patagonia"
 
@@ -218,9 +1729,7 @@ class PatagoniaSupplier(BaseSupplier):
                     address=str(data.get("address", ""))
                 ),
                 description=str(data.get("info", "")),
-                amenities=Amenities(
-                    room=[str(a).strip() for a in amenities_list if a]
-                ),
+                amenities=self.normalize_amenities(room=amenities_list),
                 images=Images(
                     rooms=[
                         Image(str(img["url"]), str(img["description"]))
@@ -232,66 +1741,1481 @@ class PatagoniaSupplier(BaseSupplier):
                         for img in images_data.get("amenities", [])
                         if isinstance(img, dict) and "url" in img and "description" in img
                     ]
-                )
+                ),
+                source=self.name
             )
         except Exception as e:
             print(f"Error parsing Patagonia data: {e}")
             return None
 
-class HotelService:
-    def __init__(self):
+EARTH_RADIUS_KM = 6371.0088
+
+def haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+class GeoIndex:
+    """Grid of cell_size-degree cells over hotel coordinates.
+
+    Radius and bounding-box queries only visit the cells overlapping the
+    area, so they cost in proportion to the hotels near the query, not the
+    catalog size. Hotels at 0,0 (no coordinates from any supplier) or out
+    of range are not indexed.
+    """
+
+    def __init__(self, cell_size: float = 0.1):
+        self.cell_size = cell_size
+        self.cells: Dict[Tuple[int, int], Dict[str, Hotel]] = {}
+        self.keys: Dict[str, Tuple[int, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def cell(self, lat: float, lng: float) -> Tuple[int, int]:
+        return math.floor(lat / self.cell_size), math.floor(lng / self.cell_size)
+
+    def add(self, hotel: Hotel) -> None:
+        """Index a hotel, or move or replace it after its coordinates or object changed"""
+        lat, lng = hotel.location.lat, hotel.location.lng
+        located = (lat or lng) and -90.0 <= lat <= 90.0 and -180.0 <= lng <= 180.0
+        key = self.cell(lat, lng) if located else None
+        old_key = self.keys.get(hotel.id)
+        if old_key is not None and old_key != key:
+            self.remove(hotel.id)
+        if key is not None:
+            self.cells.setdefault(key, {})[hotel.id] = hotel
+            self.keys[hotel.id] = key
+
+    def remove(self, hotel_id: str) -> None:
+        key = self.keys.pop(hotel_id, None)
+        if key is None:
+            return
+        cell = self.cells[key]
+        del cell[hotel_id]
+        if not cell:
+            del self.cells[key]
+
+    def within_bbox(self, south: float, west: float, north: float, east: float) -> List[Hotel]:
+        """Hotels inside the box; west > east means it crosses the antimeridian"""
+        ranges = [(west, east)] if west <= east else [(west, 180.0), (-180.0, east)]
+        return [hotel
+                for low, high in ranges
+                for hotel in self._candidates(south, low, north, high)
+                if south <= hotel.location.lat <= north and low <= hotel.location.lng <= high]
+
+    def within_radius(self, lat: float, lng: float, km: float) -> List[Hotel]:
+        """Hotels within km of the point, nearest first"""
+        angle = km / EARTH_RADIUS_KM
+        south, north = lat - math.degrees(angle), lat + math.degrees(angle)
+        if south <= -90.0 or north >= 90.0 or angle >= math.pi / 2:
+            ranges = [(-180.0, 180.0)]
+        else:
+            # Widest longitude span of the circle, reached north or south of its center
+            span = math.degrees(math.asin(min(1.0, math.sin(angle) / math.cos(math.radians(lat)))))
+            west, east = lng - span, lng + span
+            ranges = ([(west, east)] if -180.0 <= west and east <= 180.0 else
+                      [(-180.0, east - 360.0), (west, 180.0)] if east > 180.0 else
+                      [(west + 360.0, 180.0), (-180.0, east)])
+        # haversine_km inlined, comparing the haversine term against its value at km
+        lat_r, lng_r, cos_lat = math.radians(lat), math.radians(lng), math.cos(math.radians(lat))
+        limit = math.sin(min(angle, math.pi) / 2) ** 2
+        sin, cos, radians = math.sin, math.cos, math.radians
+        found = []
+        for low, high in ranges:
+            for hotel in self._candidates(max(south, -90.0), low, min(north, 90.0), high):
+                other_lat = radians(hotel.location.lat)
+                a = (sin((other_lat - lat_r) / 2) ** 2 +
+                     cos_lat * cos(other_lat) * sin((radians(hotel.location.lng) - lng_r) / 2) ** 2)
+                if a <= limit:
+                    found.append((a, hotel.id, hotel))
+        found.sort(key=lambda item: item[:2])
+        return [hotel for _, _, hotel in found]
+
+    def _candidates(self, south: float, west: float, north: float, east: float) -> Iterator[Hotel]:
+        (low_y, low_x), (high_y, high_x) = self.cell(south, west), self.cell(north, east)
+        # A large area has more cells than there are non-empty ones; scan those instead
+        if (high_y - low_y + 1) * (high_x - low_x + 1) > len(self.cells):
+            for (y, x), cell in self.cells.items():
+                if low_y <= y <= high_y and low_x <= x <= high_x:
+                    yield from cell.values()
+            return
+        for y in range(low_y, high_y + 1):
+            for x in range(low_x, high_x + 1):
+                cell = self.cells.get((y, x))
+                if cell:
+                    yield from cell.values()
+
+class TextIndex:
+    """Inverted index over hotel names, descriptions and amenities.
+
+    Each term maps to the hotels containing it and their term frequency,
+    weighted by field (FIELD_WEIGHTS). Queries are ranked with BM25 over the
+    postings of their own terms only, and the best limit are picked with a
+    heap. Re-adding a hotel replaces its postings, so the index follows
+    merges incrementally.
+    """
+    FIELD_WEIGHTS = {'name': 2.0, 'description': 1.0, 'amenities': 1.0}
+    _WORD = re.compile(r'[^\W_]+')
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, Dict[str, float]] = {}
+        # Per hotel, its weighted term frequencies and document length
+        self.terms: Dict[str, Dict[str, float]] = {}
+        self.lengths: Dict[str, float] = {}
+        self.total_length = 0.0
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+    @classmethod
+    def tokenize(cls, text: str) -> List[str]:
+        return cls._WORD.findall(text.lower())
+
+    def add(self, hotel: Hotel) -> None:
+        """Index a hotel, or re-index it after a merge changed its text"""
+        terms: Dict[str, float] = {}
+        for name, text in (('name', hotel.name), ('description', hotel.description),
+                           ('amenities', ' '.join(hotel.amenities.general + hotel.amenities.room))):
+            weight = self.FIELD_WEIGHTS[name]
+            for term in self.tokenize(text):
+                terms[term] = terms.get(term, 0.0) + weight
+        if self.terms.get(hotel.id) == terms:
+            return
+        self.remove(hotel.id)
+        if not terms:
+            return
+        self.terms[hotel.id] = terms
+        self.lengths[hotel.id] = length = sum(terms.values())
+        self.total_length += length
+        for term, frequency in terms.items():
+            self.postings.setdefault(term, {})[hotel.id] = frequency
+
+    def remove(self, hotel_id: str) -> None:
+        terms = self.terms.pop(hotel_id, None)
+        if terms is None:
+            return
+        self.total_length -= self.lengths.pop(hotel_id)
+        for term in terms:
+            posting = self.postings[term]
+            del posting[hotel_id]
+            if not posting:
+                del self.postings[term]
+
+    def search(self, text: str, limit: Optional[int] = None,
+               allowed: Optional[set] = None) -> List[Tuple[str, float]]:
+        """Ids and scores of the hotels matching any query term, best first.
+
+        allowed restricts the candidates, e.g. to the results of other filters.
+        """
+        count = len(self.terms)
+        if not count:
+            return []
+        # BM25 length normalization k1 * (1 - b + b * length / average) as base + slope * length
+        base = self.k1 * (1.0 - self.b)
+        slope = self.k1 * self.b * count / self.total_length
+        lengths = self.lengths
+        scores: Dict[str, float] = {}
+        for term in dict.fromkeys(self.tokenize(text)):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            weight = (self.k1 + 1.0) * math.log(1.0 + (count - len(posting) + 0.5) / (len(posting) + 0.5))
+            if allowed is not None:
+                posting = {hotel_id: posting[hotel_id] for hotel_id in allowed if hotel_id in posting}
+            for hotel_id, frequency in posting.items():
+                scores[hotel_id] = (scores.get(hotel_id, 0.0) +
+                                    weight * frequency / (frequency + base + slope * lengths[hotel_id]))
+        # Ties go to the smaller id so results are stable
+        rank = lambda item: (-item[1], item[0])
+        if limit is None:
+            return sorted(scores.items(), key=rank)
+        return heapq.nsmallest(limit, scores.items(), key=rank)
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+def geohash(lat: float, lng: float, precision: int = 6) -> str:
+    """Standard base32 geohash of a point"""
+    bounds = [[-90.0, 90.0], [-180.0, 180.0]]
+    chars = []
+    bit, value, even = 0, 0, True
+    while len(chars) < precision:
+        low_high = bounds[1] if even else bounds[0]
+        coordinate = lng if even else lat
+        middle = (low_high[0] + low_high[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            low_high[0] = middle
+        else:
+            low_high[1] = middle
+        even = not even
+        bit += 1
+        if bit == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bit, value = 0, 0
+    return ''.join(chars)
+
+@dataclass
+class ResolverConfig:
+    """Tuning of cross-supplier entity resolution.
+
+    MinHash signatures have bands * rows values; two names become LSH
+    candidates when one band agrees, which for 16 x 4 happens mostly above
+    a Jaccard similarity of about (1 / bands) ** (1 / rows) = 0.5. A match
+    needs a score of threshold, at most max_km between the records when
+    both have coordinates and, when both have an address, addresses that
+    agree: the same house numbers (one set containing the other) and a
+    similarity of at least min_address.
+    """
+    threshold: float = 0.5
+    min_address: float = 0.3
+    bands: int = 16
+    rows: int = 4
+    max_km: float = 0.5
+    geohash_precision: int = 6
+
+@dataclass(slots=True)
+class ResolvedRecord:
+    """What the entity resolver indexed of one supplier record"""
+    canonical: str
+    destination_id: str
+    name: str
+    address: str
+    point: Optional[Tuple[float, float]]
+    # MinHash signatures (see EntityResolver.signature); a record whose name
+    # has no words is not indexed for matching
+    name_signature: Optional[Tuple[int, ...]]
+    address_signature: Optional[Tuple[int, ...]]
+    # House numbers of the address (see EntityResolver.house_numbers)
+    numbers: FrozenSet[str]
+
+class EntityResolver:
+    """Maps supplier hotel ids onto canonical ids across suppliers.
+
+    A record whose id is not known yet is compared only with hotels of the
+    same destination that share its geohash cell (or a neighbouring one) or
+    an LSH bucket of its name's MinHash signature, never with the whole
+    catalog. Candidates are scored on name and address similarity, as
+    estimated from MinHash signatures; the best one above the threshold
+    becomes the record's canonical id. Records from the same supplier with
+    different ids are never merged. A record keeps its canonical id when it
+    changes, but is indexed anew, and forget drops records suppliers no
+    longer list.
+    """
+    _PRIME = (1 << 61) - 1
+
+    def __init__(self, config: Optional[ResolverConfig] = None):
+        self.config = config or ResolverConfig()
+        rng = random.Random(0)
+        size = self.config.bands * self.config.rows
+        self._coefficients = [(rng.randrange(1, self._PRIME), rng.randrange(self._PRIME)) for _ in range(size)]
+        # Supplier id -> canonical id, for ids that are not canonical themselves
+        self.aliases: Dict[str, str] = {}
+        # Canonical id -> supplier name -> that supplier's id
+        self.members: Dict[str, Dict[str, str]] = {}
+        # (supplier, supplier id) -> the record as indexed, for every record seen
+        self.indexed: Dict[Tuple[str, str], ResolvedRecord] = {}
+        # Canonical id -> (supplier, supplier id) -> its member records that
+        # have a name signature, which are the ones candidates are scored on
+        self.records: Dict[str, Dict[Tuple[str, str], ResolvedRecord]] = {}
+        self.cells: Dict[Tuple[str, str], set] = {}
+        self.buckets: Dict[Tuple[str, int, Tuple[int, ...]], set] = {}
+        self.matches = 0
+
+    def resolve(self, hotel: Hotel) -> str:
+        """Canonical id for a supplier record, indexing the record under it"""
+        key = (hotel.source, hotel.id)
+        indexed = self.indexed.get(key)
+        point = self._point(hotel)
+        if indexed is not None:
+            if (indexed.destination_id, indexed.name, indexed.address, indexed.point) != (
+                    hotel.destination_id, hotel.name, hotel.location.address, point):
+                self._unindex(key, indexed)
+                self._index(key, self._record(indexed.canonical, hotel, point))
+            return indexed.canonical
+
+        record = self._record(hotel.id, hotel, point)
+        canonical = self.aliases.get(hotel.id)
+        if canonical is None:
+            canonical = hotel.id if hotel.id in self.members else self.match(hotel, record)
+            if canonical is None:
+                canonical = hotel.id
+            elif canonical != hotel.id:
+                self.aliases[hotel.id] = canonical
+                self.matches += 1
+        record.canonical = canonical
+        self.members.setdefault(canonical, {}).setdefault(hotel.source, hotel.id)
+        self._index(key, record)
+        return canonical
+
+    def forget(self, source: str, hotel_id: str) -> None:
+        """Drop a record its supplier no longer lists"""
+        record = self.indexed.get((source, hotel_id))
+        if record is None:
+            return
+        self._unindex((source, hotel_id), record)
+        members = self.members.get(record.canonical, {})
+        if members.get(source) == hotel_id:
+            del members[source]
+        if not members:
+            self.members.pop(record.canonical, None)
+        if hotel_id not in members.values():
+            self.aliases.pop(hotel_id, None)
+
+    def match(self, hotel: Hotel, record: ResolvedRecord) -> Optional[str]:
+        if record.name_signature is None:
+            return None
+        best, best_score = None, 0.0
+        for candidate in sorted(self._candidates(record)):
+            if self.members.get(candidate, {}).get(hotel.source, hotel.id) != hotel.id:
+                continue
+            score = self._score(candidate, record)
+            if score >= self.config.threshold and score > best_score:
+                best, best_score = candidate, score
+        return best
+
+    def signature(self, text: str) -> Optional[Tuple[int, ...]]:
+        """MinHash of the word trigrams of text, or None if it has no words"""
+        words = TextIndex.tokenize(text or '')
+        shingles = {word[i:i + 3] for word in words for i in range(max(1, len(word) - 2))}
+        if not shingles:
+            return None
+        hashes = [int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'big')
+                  for shingle in shingles]
+        prime = self._PRIME
+        return tuple(min((a * value + b) % prime for value in hashes) for a, b in self._coefficients)
+
+    @staticmethod
+    def house_numbers(address: str) -> FrozenSet[str]:
+        """Words of an address that contain digits: house, unit and postal numbers"""
+        return frozenset(word for word in TextIndex.tokenize(address or '') if any(c.isdigit() for c in word))
+
+    @staticmethod
+    def similarity(first: Tuple[int, ...], second: Tuple[int, ...]) -> float:
+        """Jaccard similarity estimated from two MinHash signatures"""
+        return sum(x == y for x, y in zip(first, second)) / len(first)
+
+    def _record(self, canonical: str, hotel: Hotel, point: Optional[Tuple[float, float]]) -> ResolvedRecord:
+        """The record's signatures, computed once for both matching and indexing"""
+        name = self.signature(hotel.name)
+        address = hotel.location.address
+        return ResolvedRecord(canonical, hotel.destination_id, hotel.name, address, point, name,
+                              self.signature(address) if name is not None else None,
+                              self.house_numbers(address))
+
+    def _score(self, candidate: str, record: ResolvedRecord) -> float:
+        others = self.records[candidate].values()
+        if record.point is not None:
+            distances = [haversine_km(*record.point, *other.point) for other in others if other.point is not None]
+            if distances and min(distances) > self.config.max_km:
+                return 0.0
+        name, address, numbers = record.name_signature, record.address_signature, record.numbers
+        score, addressed, agreed = 0.0, False, False
+        for other in others:
+            name_score = self.similarity(name, other.name_signature)
+            if address is not None and other.address_signature is not None:
+                address_score = self.similarity(address, other.address_signature)
+                addressed = True
+                if address_score < self.config.min_address or not (
+                        numbers <= other.numbers or other.numbers <= numbers):
+                    continue
+                agreed = True
+                name_score = 0.7 * name_score + 0.3 * address_score
+            score = max(score, name_score)
+        # A record never joins a hotel whose known addresses all disagree with its own
+        return score if agreed or not addressed else 0.0
+
+    def _candidates(self, record: ResolvedRecord) -> set:
+        candidates = set()
+        for bucket in self._bucket_keys(record):
+            candidates |= self.buckets.get(bucket, set())
+        if record.point is not None:
+            for cell in self._neighbourhood(*record.point):
+                candidates |= self.cells.get((record.destination_id, cell), set())
+        return candidates
+
+    def _index(self, key: Tuple[str, str], record: ResolvedRecord) -> None:
+        self.indexed[key] = record
+        if record.name_signature is None:
+            return
+        self.records.setdefault(record.canonical, {})[key] = record
+        for index, keys in ((self.buckets, self._bucket_keys), (self.cells, self._cell_keys)):
+            for index_key in keys(record):
+                index.setdefault(index_key, set()).add(record.canonical)
+
+    def _unindex(self, key: Tuple[str, str], record: ResolvedRecord) -> None:
+        """Remove a record from the index; its hotel leaves a bucket or cell
+        only when none of its other records is in it"""
+        del self.indexed[key]
+        records = self.records.get(record.canonical, {})
+        if records.pop(key, None) is None:
+            return
+        for index, keys in ((self.buckets, self._bucket_keys), (self.cells, self._cell_keys)):
+            remaining = {index_key for other in records.values() for index_key in keys(other)}
+            for index_key in set(keys(record)) - remaining:
+                hotels = index[index_key]
+                hotels.discard(record.canonical)
+                if not hotels:
+                    del index[index_key]
+        if not records:
+            del self.records[record.canonical]
+
+    def _bucket_keys(self, record: ResolvedRecord) -> List[Tuple[str, int, Tuple[int, ...]]]:
+        return [(record.destination_id, *band) for band in self._bands(record.name_signature)]
+
+    def _cell_keys(self, record: ResolvedRecord) -> List[Tuple[str, str]]:
+        if record.point is None:
+            return []
+        return [(record.destination_id, geohash(*record.point, self.config.geohash_precision))]
+
+    def _bands(self, signature: Tuple[int, ...]) -> Iterator[Tuple[int, Tuple[int, ...]]]:
+        rows = self.config.rows
+        for band in range(self.config.bands):
+            yield band, signature[band * rows:(band + 1) * rows]
+
+    def _neighbourhood(self, lat: float, lng: float) -> set:
+        """Geohash cells of the point and the eight around it"""
+        precision = self.config.geohash_precision
+        height = 180.0 / 2 ** (5 * precision // 2)
+        width = 360.0 / 2 ** (5 * precision - 5 * precision // 2)
+        return {geohash(max(-90.0, min(90.0, lat + dy * height)),
+                        (lng + dx * width + 180.0) % 360.0 - 180.0, precision)
+                for dy in (-1, 0, 1) for dx in (-1, 0, 1)}
+
+    @staticmethod
+    def _point(hotel: Hotel) -> Optional[Tuple[float, float]]:
+        lat, lng = hotel.location.lat, hotel.location.lng
+        if (lat or lng) and -90.0 <= lat <= 90.0 and -180.0 <= lng <= 180.0:
+            return lat, lng
+        return None
+
+class CatalogSnapshot:
+    """Binary snapshot of a merged catalog, reopened through mmap.
+
+    Layout, all integers little-endian:
+
+      header        magic, version, hotel / string / destination counts and
+                    the offsets of the sections below
+      records       one per hotel, in catalog order: string ids (u32) and
+                    coordinates (f64), lists prefixed by their length
+      offset table  hotel_count + 1 u64 record offsets
+      string data   every distinct string once, UTF-8
+      string table  string_count + 1 u64 offsets into the string data
+      id index      record numbers (u32) sorted by hotel id
+      destinations  (destination string id, first posting, posting count)
+                    u32 triples sorted by destination, then the postings:
+                    record numbers in catalog order
+
+    Opening reads only the header. Lookups by id or destination binary
+    search the indexes and decode just the hotels they return; decoded
+    hotels are kept for later queries.
+    """
+    MAGIC = b'HOTELSNP'
+    VERSION = 2
+    _HEADER = struct.Struct('<8sHHIIIQQQQQ')
+    _RECORD_HEAD = struct.Struct('<3I2d5I')
+    _U32 = struct.Struct('<I')
+    _U64_PAIR = struct.Struct('<2Q')
+    _DESTINATION = struct.Struct('<3I')
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            (magic, version, _, self.count, self.string_count, self.destination_count, self._offsets,
+             self._strings, self._ids, self._destinations, self._size) = self._HEADER.unpack_from(self._mm)
+        except struct.error:
+            self._mm.close()
+            raise ValueError(f"{path} is not a hotel catalog snapshot")
+        if magic != self.MAGIC or version != self.VERSION or self._size != len(self._mm):
+            self._mm.close()
+            raise ValueError(f"{path} is not a hotel catalog snapshot (or was written by another version)")
+        self._decoded: Dict[int, Hotel] = {}
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __iter__(self) -> Iterator[Hotel]:
+        return (self.hotel(index) for index in range(self.count))
+
+    def close(self) -> None:
+        self._mm.close()
+
+    @classmethod
+    def write(cls, hotels: Iterable[Hotel], path: str) -> None:
+        """Write a snapshot next to path and move it into place atomically"""
+        strings: Dict[str, int] = {}
+        intern = lambda text: strings.setdefault(text, len(strings))
+        ids: List[str] = []
+        destinations: Dict[str, List[int]] = {}
+        directory = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(bytes(cls._HEADER.size))
+                offsets = []
+                for hotel in hotels:
+                    destinations.setdefault(hotel.destination_id, []).append(len(ids))
+                    ids.append(hotel.id)
+                    offsets.append(f.tell())
+                    f.write(cls._encode(hotel, intern))
+                offsets.append(f.tell())
+                offset_table = f.tell()
+                f.write(struct.pack(f'<{len(offsets)}Q', *offsets))
+
+                string_offsets = [f.tell()]
+                for text in strings:
+                    f.write(text.encode('utf-8'))
+                    string_offsets.append(f.tell())
+                string_table = f.tell()
+                f.write(struct.pack(f'<{len(string_offsets)}Q', *string_offsets))
+
+                id_index = f.tell()
+                order = sorted(range(len(ids)), key=ids.__getitem__)
+                f.write(struct.pack(f'<{len(order)}I', *order))
+
+                destination_table = f.tell()
+                postings: List[int] = []
+                for destination_id in sorted(destinations):
+                    records = destinations[destination_id]
+                    f.write(cls._DESTINATION.pack(strings[destination_id], len(postings), len(records)))
+                    postings += records
+                f.write(struct.pack(f'<{len(postings)}I', *postings))
+                size = f.tell()
+
+                f.seek(0)
+                f.write(cls._HEADER.pack(cls.MAGIC, cls.VERSION, 0, len(ids), len(strings), len(destinations),
+                                         offset_table, string_table, id_index, destination_table, size))
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    @classmethod
+    def _encode(cls, hotel: Hotel, intern: Callable[[str], int]) -> bytes:
+        location, images = hotel.location, hotel.images
+        values: List[Any] = [intern(hotel.id), intern(hotel.destination_id), intern(hotel.name),
+                             location.lat, location.lng, intern(location.address), intern(location.city),
+                             intern(location.country), intern(hotel.description), intern(hotel.source)]
+        layout = [cls._RECORD_HEAD.format]
+        for texts in (hotel.amenities.general, hotel.amenities.room, hotel.booking_conditions, hotel.sources):
+            layout.append(f'I{len(texts)}I')
+            values += [len(texts), *map(intern, texts)]
+        pairs = [[(image.link, image.description) for image in images.rooms],
+                 [(image.link, image.description) for image in images.site],
+                 [(image.link, image.description) for image in images.amenities]]
+        for items in pairs:
+            layout.append(f'I{2 * len(items)}I')
+            values.append(len(items))
+            for first, second in items:
+                values += [intern(first), intern(second)]
+        return struct.pack(''.join(layout), *values)
+
+    def string(self, string_id: int) -> str:
+        start, end = self._U64_PAIR.unpack_from(self._mm, self._strings + 8 * string_id)
+        return self._mm[start:end].decode('utf-8')
+
+    def hotel(self, index: int) -> Hotel:
+        """The index-th hotel in catalog order, decoded on first access"""
+        hotel = self._decoded.get(index)
+        if hotel is None:
+            hotel = self._decoded[index] = self._decode(index)
+        return hotel
+
+    def _decode(self, index: int) -> Hotel:
+        mm, string = self._mm, self.string
+        position = self._U64_PAIR.unpack_from(mm, self._offsets + 8 * index)[0]
+        (hotel_id, destination_id, name, lat, lng, address, city, country, description,
+         source) = self._RECORD_HEAD.unpack_from(mm, position)
+        position += self._RECORD_HEAD.size
+
+        def strings(per_item: int) -> List[str]:
+            nonlocal position
+            count = self._U32.unpack_from(mm, position)[0]
+            values = struct.unpack_from(f'<{count * per_item}I', mm, position + 4)
+            position += 4 + 4 * count * per_item
+            return [string(value) for value in values]
+
+        def pairs() -> List[Tuple[str, str]]:
+            values = strings(2)
+            return list(zip(values[::2], values[1::2]))
+
+        general, room, booking_conditions, sources = strings(1), strings(1), strings(1), strings(1)
+        rooms, site, amenities = pairs(), pairs(), pairs()
+        return Hotel(
+            id=string(hotel_id),
+            destination_id=string(destination_id),
+            name=string(name),
+            location=Location(lat=lat, lng=lng, address=string(address), city=string(city),
+                              country=string(country)),
+            description=string(description),
+            amenities=Amenities(general=general, room=room),
+            images=Images(
+                rooms=[Image(*image) for image in rooms],
+                site=[Image(*image) for image in site],
+                amenities=[Image(*image) for image in amenities]
+            ),
+            booking_conditions=booking_conditions,
+            source=string(source),
+            sources=tuple(sources)
+        )
+
+    def get(self, hotel_id: str) -> Optional[Hotel]:
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            record = self._U32.unpack_from(self._mm, self._ids + 4 * middle)[0]
+            if self._hotel_id(record) < hotel_id:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.count:
+            record = self._U32.unpack_from(self._mm, self._ids + 4 * low)[0]
+            if self._hotel_id(record) == hotel_id:
+                return self.hotel(record)
+        return None
+
+    def destination(self, destination_id: str) -> List[Hotel]:
+        low, high = 0, self.destination_count
+        while low < high:
+            middle = (low + high) // 2
+            if self._destination(middle)[0] < destination_id:
+                low = middle + 1
+            else:
+                high = middle
+        if low == self.destination_count:
+            return []
+        key, first, count = self._destination(low)
+        if key != destination_id:
+            return []
+        postings = self._destinations + self._DESTINATION.size * self.destination_count + 4 * first
+        return [self.hotel(record) for record in struct.unpack_from(f'<{count}I', self._mm, postings)]
+
+    def find(self, hotel_ids: Optional[List[str]] = None,
+             destination_ids: Optional[List[str]] = None) -> List[Hotel]:
+        """HotelService.find for ids and destinations, straight from the snapshot"""
+        if hotel_ids:
+            hotels = [hotel for hotel in map(self.get, dict.fromkeys(hotel_ids)) if hotel is not None]
+            if destination_ids:
+                destination_ids_set = set(destination_ids)
+                hotels = [h for h in hotels if h.destination_id in destination_ids_set]
+            return hotels
+        if destination_ids:
+            return [hotel for destination_id in dict.fromkeys(destination_ids)
+                    for hotel in self.destination(destination_id)]
+        return list(self)
+
+    def _hotel_id(self, record: int) -> str:
+        position = self._U64_PAIR.unpack_from(self._mm, self._offsets + 8 * record)[0]
+        return self.string(self._U32.unpack_from(self._mm, position)[0])
+
+    def _destination(self, position: int) -> Tuple[str, int, int]:
+        string_id, first, count = self._DESTINATION.unpack_from(
+            self._mm, self._destinations + self._DESTINATION.size * position)
+        return self.string(string_id), first, count
+
+class RecordChanges:
+    """One supplier's records from a refresh, compared as they arrive with
+    the rows the catalog holds for that supplier (see Catalog.update).
+
+    Only records that differ are kept, so a refresh that changes little
+    costs little memory however large the payload.
+    """
+
+    def __init__(self, current: Dict[str, Tuple[HotelRow, ...]]):
+        self.current = current
+        # Supplier id -> records with that id seen so far; ids repeat only
+        # when a payload lists a hotel twice
+        self.seen: Dict[str, int] = {}
+        self.changed: Dict[str, List[HotelRow]] = {}
+
+    def add(self, hotels: Iterable[Hotel]) -> None:
+        for hotel in hotels:
+            row = hotel_to_row(hotel)
+            count = self.seen.get(hotel.id, 0)
+            self.seen[hotel.id] = count + 1
+            rows = self.changed.get(hotel.id)
+            if rows is not None:
+                rows.append(row)
+                continue
+            old = self.current.get(hotel.id, ())
+            if count < len(old) and old[count] == row:
+                continue
+            self.changed[hotel.id] = [*old[:count], row]
+
+    def result(self) -> Dict[str, Tuple[HotelRow, ...]]:
+        """New rows of each changed supplier id, empty for the ids the supplier dropped"""
+        changed = {hotel_id: tuple(rows) for hotel_id, rows in self.changed.items()}
+        for hotel_id, rows in self.current.items():
+            count = self.seen.get(hotel_id, 0)
+            if hotel_id not in changed and count != len(rows):
+                changed[hotel_id] = rows[:count]
+        return changed
+
+class Catalog:
+    """Merged hotels with their destination, spatial and text indexes.
+
+    Each hotel is merged from the supplier records it was resolved from,
+    which the catalog keeps as rows (see hotel_to_row). When a supplier's
+    records change only the hotels they belong to are rebuilt; a rebuilt
+    hotel is a new object, so hotels are never modified once in the catalog
+    and the others keep their cached serializations.
+    """
+
+    def __init__(self, resolver: Optional[EntityResolver] = None):
         self.hotels: Dict[str, Hotel] = {}
+        self.by_destination: Dict[str, Dict[str, Hotel]] = {}
+        self.geo = GeoIndex()
+        self.text = TextIndex()
+        self.resolver = resolver
+        # Supplier name -> supplier hotel id -> that supplier's records of it
+        self.records: Dict[str, Dict[str, Tuple[HotelRow, ...]]] = {}
+
+    def changes(self, source: str) -> RecordChanges:
+        return RecordChanges(self.records.get(source, {}))
+
+    def merge(self, hotels: Iterable[Hotel]) -> None:
+        """Add records next to the ones the catalog holds and rebuild their hotels"""
+        dirty: Dict[str, None] = {}
+        for hotel in hotels:
+            records = self.records.setdefault(hotel.source, {})
+            records[hotel.id] = records.get(hotel.id, ()) + (hotel_to_row(hotel),)
+            dirty[self._resolve(hotel)] = None
+        self.rebuild(dirty)
+
+    def update(self, source: str, changes: Dict[str, Tuple[HotelRow, ...]]) -> List[str]:
+        """Replace a supplier's records, as collected by RecordChanges.
+
+        Returns the ids of the hotels to rebuild, in the order the records
+        arrived; until they are rebuilt those hotels keep their old contents.
+        """
+        records = self.records.setdefault(source, {})
+        dirty: Dict[str, None] = {}
+        for hotel_id, rows in changes.items():
+            if hotel_id in records:
+                dirty[self._canonical(hotel_id)] = None
+            if rows:
+                records[hotel_id] = rows
+                dirty[self._resolve(hotel_from_row(rows[0]))] = None
+            elif records.pop(hotel_id, None) is not None and self.resolver is not None:
+                self.resolver.forget(source, hotel_id)
+        return list(dirty)
+
+    def rebuild(self, hotel_ids: Iterable[str]) -> None:
+        """Merge these hotels anew from their records, dropping those with none left"""
+        for hotel_id in hotel_ids:
+            rows = [row for source, supplier_id in self._members(hotel_id)
+                    for row in self.records.get(source, {}).get(supplier_id, ())]
+            old = self.hotels.get(hotel_id)
+            if not rows:
+                if old is not None:
+                    self._remove(old)
+                continue
+            hotel = hotel_from_row(rows[0])
+            if len(rows) == 1:
+                # Merged images come out normalized; a single record's need it too
+                hotel.images.normalize()
+            for row in rows[1:]:
+                hotel.merge(hotel_from_row(row))
+            hotel.id = hotel_id
+            if old is not None and old.destination_id != hotel.destination_id:
+                self._remove_destination(old)
+            self.hotels[hotel_id] = hotel
+            self.by_destination.setdefault(hotel.destination_id, {})[hotel_id] = hotel
+            self.geo.add(hotel)
+            self.text.add(hotel)
+
+    def _resolve(self, hotel: Hotel) -> str:
+        return self.resolver.resolve(hotel) if self.resolver is not None else hotel.id
+
+    def _canonical(self, hotel_id: str) -> str:
+        return self.resolver.aliases.get(hotel_id, hotel_id) if self.resolver is not None else hotel_id
+
+    def _members(self, hotel_id: str) -> Iterable[Tuple[str, str]]:
+        """(supplier name, supplier id) of the records a hotel may be merged from"""
+        if self.resolver is not None:
+            return self.resolver.members.get(hotel_id, {}).items()
+        return [(source, hotel_id) for source in self.records]
+
+    def _remove(self, hotel: Hotel) -> None:
+        del self.hotels[hotel.id]
+        self._remove_destination(hotel)
+        self.geo.remove(hotel.id)
+        self.text.remove(hotel.id)
+
+    def _remove_destination(self, hotel: Hotel) -> None:
+        bucket = self.by_destination.get(hotel.destination_id, {})
+        bucket.pop(hotel.id, None)
+        if not bucket:
+            self.by_destination.pop(hotel.destination_id, None)
+
+class HotelService:
+    # Hotels rebuilt between two yields to the event loop during a refresh
+    rebuild_batch = 1000
+
+    def __init__(self, client_config: Optional[ClientConfig] = None,
+                 cache: Optional[ResponseCache] = None, streaming: bool = False,
+                 retry_policy: Optional[RetryPolicy] = None, deadline: Optional[float] = None,
+                 breaker_config: Optional[BreakerConfig] = None,
+                 hedge_policy: Optional[HedgePolicy] = None,
+                 parser_pool: Optional[ParserPool] = None,
+                 resolver: Optional[EntityResolver] = None,
+                 snapshot_path: Optional[str] = None):
+        # Matches records across suppliers whose ids differ; off by default
+        self.resolver = resolver
+        # The catalog queries are answered from, updated in place by each refresh
+        self.catalog = Catalog(resolver)
+        # Catalog saved by an earlier process, answering queries until the
+        # first refresh replaces it
+        self.snapshot_path = snapshot_path
+        self.snapshot: Optional[CatalogSnapshot] = None
+        if snapshot_path is not None and os.path.exists(snapshot_path):
+            try:
+                self.snapshot = CatalogSnapshot(snapshot_path)
+            except (OSError, ValueError) as e:
+                print(f"Error opening catalog snapshot: {str(e)}")
         self.suppliers = [
-            AcmeSupplier(),
-            PaperfliesSupplier(),
-            PatagoniaSupplier()
+            AcmeSupplier(breaker_config),
+            PaperfliesSupplier(breaker_config),
+            PatagoniaSupplier(breaker_config)
         ]
+        self.client_config = client_config or ClientConfig()
+        self.cache = cache
+        self._state_restored = False
+        self.streaming = streaming
+        # Seconds fetch_all may take before slow suppliers are cut off
+        self.deadline = deadline
+        for supplier in self.suppliers:
+            if retry_policy is not None:
+                supplier.retry_policy = retry_policy
+            if hedge_policy is not None:
+                supplier.hedger = Hedger(hedge_policy)
+            supplier.parser_pool = parser_pool
+        self.parser_pool = parser_pool
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def hotels(self) -> Dict[str, Hotel]:
+        return self.catalog.hotels
+
+    @property
+    def by_destination(self) -> Dict[str, Dict[str, Hotel]]:
+        return self.catalog.by_destination
+
+    @property
+    def geo(self) -> GeoIndex:
+        return self.catalog.geo
+
+    @property
+    def text(self) -> TextIndex:
+        return self.catalog.text
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Pooled HTTP client shared by every supplier, created on first use"""
+        if self._client is None:
+            self._client = self.client_config.build()
+        return self._client
+
+    async def aclose(self) -> None:
+        if self.snapshot is not None:
+            self.snapshot.close()
+            self.snapshot = None
+        if self.cache is not None:
+            await self.cache.drain()
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        if self.parser_pool is not None:
+            self.parser_pool.shutdown()
+
+    async def __aenter__(self) -> 'HotelService':
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+    async def fetch_all(self, concurrent: bool = True, query: Optional[HotelQuery] = None) -> None:
+        """Refresh the catalog from every supplier; a query limits parsing to matching records.
+
+        Each supplier's records are compared with the ones the catalog holds
+        for it as they arrive. Once every supplier is done, the hotels whose
+        records changed are rebuilt in supplier order, a batch at a time so
+        queries keep being answered, and the others are left as they are:
+        when nothing changed the catalog is not touched at all. Suppliers
+        whose data is unchanged (304 Not Modified), that fail, or that are
+        still running when the deadline expires and get cancelled keep the
+        records they last delivered in full.
+
+        While a snapshot is being served, it is only replaced once every
+        supplier has delivered its records. Only unfiltered catalogs are
+        saved as the new snapshot.
+        """
+        end = None if self.deadline is None else asyncio.get_running_loop().time() + self.deadline
+        if self.resolver is not None:
+            # Records of the requested hotels may carry other suppliers' ids
+            query = None
+        self._restore_state()
+        try:
+            changes = {supplier.name: self.catalog.changes(supplier.name) for supplier in self.suppliers}
+            await self._collect_all(changes, concurrent, query, end)
+            dirty: Dict[str, None] = {}
+            for supplier in self.suppliers:
+                if supplier.refreshed:
+                    dirty.update(dict.fromkeys(self.catalog.update(supplier.name, changes[supplier.name].result())))
+            del changes
+            hotel_ids = list(dirty)
+            for start in range(0, len(hotel_ids), self.rebuild_batch):
+                if start:
+                    await asyncio.sleep(0)
+                self.catalog.rebuild(hotel_ids[start:start + self.rebuild_batch])
+
+            if self.snapshot is not None:
+                missing = [supplier.name for supplier in self.suppliers if supplier.name not in self.catalog.records]
+                if missing:
+                    print(f"No hotels from {', '.join(missing)}, still serving the catalog snapshot")
+                    return
+                self.snapshot.close()
+                self.snapshot = None
+            if self.snapshot_path is not None and query is None and hotel_ids:
+                # Refreshes replace hotels instead of modifying them (see
+                # Catalog), so the listed ones can be written off the loop
+                await asyncio.to_thread(self._write_snapshot, list(self.hotels.values()), self.snapshot_path)
+        finally:
+            self._save_state()
+
+    def save_snapshot(self, path: str) -> None:
+        """Write the merged catalog to a snapshot (see CatalogSnapshot)"""
+        self._load_snapshot()
+        self._write_snapshot(list(self.hotels.values()), path)
+
+    @staticmethod
+    def _write_snapshot(hotels: List[Hotel], path: str) -> None:
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            CatalogSnapshot.write(hotels, path)
+        except OSError as e:
+            print(f"Error saving catalog snapshot: {str(e)}")
+
+    def _load_snapshot(self) -> None:
+        """Decode the whole snapshot into the catalog, before anything is merged on top.
+        This blocks for the whole decode, so the server never asks for it."""
+        snapshot, self.snapshot = self.snapshot, None
+        if snapshot is not None:
+            self.merge_hotels(list(snapshot))
+            snapshot.close()
+
+    async def _collect_all(self, changes: Dict[str, RecordChanges], concurrent: bool,
+                           query: Optional[HotelQuery], end: Optional[float]) -> None:
+        """Collect each supplier's records into its changes; suppliers still
+        running at the deadline are cancelled"""
+        client = self.client
+        batches = [self.suppliers] if concurrent else [[supplier] for supplier in self.suppliers]
+        for batch in batches:
+            tasks = {asyncio.ensure_future(self._collect(supplier, client, changes[supplier.name], query)): supplier
+                     for supplier in batch}
+            timeout = None if end is None else max(0.0, end - asyncio.get_running_loop().time())
+            _, pending = await asyncio.wait(tasks, timeout=timeout)
+            for task in pending:
+                task.cancel()
+                print(f"Deadline of {self.deadline}s exceeded, cutting off {tasks[task].endpoint()}")
+            if pending:
+                await asyncio.wait(pending)
+
+    async def _collect(self, supplier: BaseSupplier, client: httpx.AsyncClient, changes: RecordChanges,
+                       query: Optional[HotelQuery]) -> None:
+        # Streams and pages are compared as they arrive and never held whole
+        if self.streaming:
+            async with contextlib.aclosing(supplier.stream(client, self.cache, query)) as hotels:
+                async for hotel in hotels:
+                    changes.add((hotel,))
+        elif supplier.pagination is not None:
+            async with contextlib.aclosing(supplier.pages(client, self.cache, query)) as pages:
+                async for hotels in pages:
+                    changes.add(hotels)
+        else:
+            hotels = await supplier.fetch(client, self.cache, query)
+            if hotels:
+                changes.add(hotels)
+
+    def _state_path(self, name: str) -> Optional[str]:
+        # Supplier state lives next to the response cache so one-shot CLI runs
+        # carry on from recent ones: breakers skip a supplier they found dead
+        # and hedging has the latencies it needs before it starts
+        return os.path.join(self.cache.directory, name) if self.cache is not None else None
 
-    async def fetch_all(self) -> None:
+    def _restore_state(self) -> None:
+        if self.cache is None or self._state_restored:
+            return
+        self._state_restored = True
+        breakers, latencies = self._read_state('breakers.json'), self._read_state('latencies.json')
         for supplier in self.suppliers:
-            hotels = await supplier.fetch()
-            self.merge_hotels(hotels)
+            if supplier.name in breakers:
+                supplier.breaker.restore(breakers[supplier.name])
+            if supplier.hedger is not None and supplier.name in latencies:
+                supplier.hedger.restore(latencies[supplier.name])
 
-    def merge_hotels(self, hotels: List[Hotel]) -> None:
-        for hotel in hotels:
-            if hotel.id in self.hotels:
-                self.hotels[hotel.id].merge(hotel)
-            else:
-                self.hotels[hotel.id] = hotel
+    def _save_state(self) -> None:
+        if self.cache is None:
+            return
+        self._write_state('breakers.json', {supplier.name: supplier.breaker.snapshot()
+                                            for supplier in self.suppliers}, 'circuit breaker state')
+        latencies = {supplier.name: supplier.hedger.snapshot() for supplier in self.suppliers
+                     if supplier.hedger is not None}
+        if latencies:
+            self._write_state('latencies.json', latencies, 'hedging latencies')
+
+    def _read_state(self, name: str) -> Dict[str, Any]:
+        try:
+            with open(self._state_path(name), 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return state if isinstance(state, dict) else {}
+
+    def _write_state(self, name: str, state: Dict[str, Any], description: str) -> None:
+        try:
+            os.makedirs(self.cache.directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache.directory, prefix='.tmp-')
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self._state_path(name))
+        except OSError as e:
+            print(f"Error saving {description}: {str(e)}")
+
+    def metrics(self) -> str:
+        """Supplier circuit breaker, hedging, rate limit and entity resolution counters in Prometheus text format"""
+        lines = [
+            '# TYPE supplier_circuit_state gauge',
+            *(f'supplier_circuit_state{{supplier="{supplier.name}",state="{state}"}} '
+              f'{int(supplier.breaker.state == state)}'
+              for supplier in self.suppliers
+              for state in (CircuitBreaker.CLOSED, CircuitBreaker.OPEN, CircuitBreaker.HALF_OPEN)),
+            '# TYPE supplier_circuit_transitions_total counter',
+            *(f'supplier_circuit_transitions_total{{supplier="{supplier.name}",from="{old}",to="{new}"}} {count}'
+              for supplier in self.suppliers
+              for (old, new), count in sorted(supplier.breaker.transitions.items())),
+            '# TYPE supplier_circuit_rejected_total counter',
+            *(f'supplier_circuit_rejected_total{{supplier="{supplier.name}"}} {supplier.breaker.rejected}'
+              for supplier in self.suppliers),
+            '# TYPE supplier_hedged_requests_total counter',
+            *(f'supplier_hedged_requests_total{{supplier="{supplier.name}"}} {supplier.hedger.hedges}'
+              for supplier in self.suppliers if supplier.hedger is not None),
+            '# TYPE supplier_hedge_wins_total counter',
+            *(f'supplier_hedge_wins_total{{supplier="{supplier.name}"}} {supplier.hedger.hedge_wins}'
+              for supplier in self.suppliers if supplier.hedger is not None),
+            '# TYPE supplier_rate_limit gauge',
+            *(f'supplier_rate_limit{{supplier="{supplier.name}"}} {supplier.limiter.rate:g}'
+              for supplier in self.suppliers),
+            '# TYPE supplier_throttled_total counter',
+            *(f'supplier_throttled_total{{supplier="{supplier.name}"}} {supplier.limiter.throttled}'
+              for supplier in self.suppliers),
+            *(['# TYPE entity_resolution_matches_total counter',
+               f'entity_resolution_matches_total {self.resolver.matches}'] if self.resolver is not None else [])
+        ]
+        return '\n'.join(lines) + '\n'
+
+    def merge_hotels(self, hotels: Iterable[Hotel]) -> None:
+        """Merge hotels straight into the current catalog"""
+        if self.snapshot is not None:
+            self._load_snapshot()
+        self.catalog.merge(hotels)
 
     def find(self, hotel_ids: Optional[List[str]] = None, 
-             destination_ids: Optional[List[str]] = None) -> List[Hotel]:
-        hotels = list(self.hotels.values())
-        
+             destination_ids: Optional[List[str]] = None,
+             radius: Optional[Tuple[float, float, float]] = None,
+             bbox: Optional[Tuple[float, float, float, float]] = None,
+             text: Optional[str] = None, limit: Optional[int] = None) -> List[Hotel]:
+        """Look up hotels through the id, destination, spatial and text indexes.
+
+        Cost scales with the number of requested ids or matching hotels, not
+        the catalog size. Results follow the order of the requested ids or
+        destinations; an unfiltered query returns the whole catalog.
+        radius is (lat, lng, km) and bbox is (south, west, north, east); with
+        neither ids nor destinations, radius results are nearest first.
+        With text, hotels matching any of its words are ranked by relevance
+        and the other filters only restrict which hotels can match. limit
+        caps the number of results. Hotel ids may also be the ids other
+        suppliers use for a resolved hotel. Until the first refresh, id and
+        destination queries are answered from the snapshot, if any; other
+        queries decode the whole snapshot first.
+        """
+        if self.snapshot is not None:
+            if radius is None and bbox is None and text is None:
+                hotels = self.snapshot.find(hotel_ids, destination_ids)
+                return hotels if limit is None else hotels[:limit]
+            self._load_snapshot()
+        if hotel_ids and self.resolver is not None:
+            hotel_ids = [self.resolver.aliases.get(hotel_id, hotel_id) for hotel_id in hotel_ids]
+        if text is not None:
+            filtered = hotel_ids or destination_ids or radius is not None or bbox is not None
+            allowed = ({hotel.id for hotel in self._filter(hotel_ids, destination_ids, radius, bbox)}
+                       if filtered else None)
+            return [self.hotels[hotel_id] for hotel_id, _ in self.text.search(text, limit, allowed)]
+        hotels = self._filter(hotel_ids, destination_ids, radius, bbox)
+        return hotels if limit is None else hotels[:limit]
+
+    def _filter(self, hotel_ids: Optional[List[str]] = None,
+                destination_ids: Optional[List[str]] = None,
+                radius: Optional[Tuple[float, float, float]] = None,
+                bbox: Optional[Tuple[float, float, float, float]] = None) -> List[Hotel]:
+        if radius is None and bbox is None:
+            return self._lookup(hotel_ids, destination_ids)
+
+        hotels = self.geo.within_radius(*radius) if radius is not None else self.geo.within_bbox(*bbox)
+        if radius is not None and bbox is not None:
+            inside = {hotel.id for hotel in self.geo.within_bbox(*bbox)}
+            hotels = [hotel for hotel in hotels if hotel.id in inside]
+        if not hotel_ids and not destination_ids:
+            return hotels
+        inside = {hotel.id for hotel in hotels}
+        return [hotel for hotel in self._lookup(hotel_ids, destination_ids) if hotel.id in inside]
+
+    def _lookup(self, hotel_ids: Optional[List[str]] = None,
+                destination_ids: Optional[List[str]] = None) -> List[Hotel]:
         if hotel_ids:
-            hotel_ids_set = set(hotel_ids)
-            hotels = [h for h in hotels if h.id in hotel_ids_set]
-            
+            hotels = [self.hotels[hotel_id] for hotel_id in dict.fromkeys(hotel_ids)
+                      if hotel_id in self.hotels]
+            if destination_ids:
+                destination_ids_set = set(destination_ids)
+                hotels = [h for h in hotels if h.destination_id in destination_ids_set]
+            return hotels
+
         if destination_ids:
-            destination_ids_set = set(destination_ids)
-            hotels = [h for h in hotels if h.destination_id in destination_ids_set]
-            
-        return hotels
+            return [hotel
+                    for destination_id in dict.fromkeys(destination_ids)
+                    for hotel in self.by_destination.get(destination_id, {}).values()]
 
-async def fetch_hotels(hotel_ids: List[str], destination_ids: List[str]) -> str:
-    service = HotelService()
-    await service.fetch_all()
-    
-    filtered_hotels = service.find(hotel_ids, destination_ids)
-    return json.dumps([hotel.to_dict() for hotel in filtered_hotels], indent=2)
+        return list(self.hotels.values())
+
+OUTPUT_FORMATS = ('pretty', 'compact', 'ndjson')
+
+def encode_hotel(hotel: Hotel, fmt: str = 'pretty') -> str:
+    if fmt == 'pretty':
+        # Indented one level deeper, as an element of the top-level list
+        return '  ' + codec.dumps(hotel.to_dict(), indent=True).replace('\n', '\n  ')
+    return codec.dumps(hotel.to_dict())
+
+def write_hotels(hotels: Iterable[Hotel], out: TextIO, fmt: str = 'pretty',
+                 cache: bool = False) -> None:
+    """Serialize hotels to out one at a time.
+
+    Only one hotel is encoded in memory at once. 'pretty' and 'compact' write
+    the same bytes as json.dumps of the whole list with indent=2 or compact
+    separators; 'ndjson' writes one compact hotel per line. With cache=True
+    each hotel keeps its encoding for later queries (see Hotel.encoded).
+    """
+    if fmt not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format {fmt!r}, expected one of {', '.join(OUTPUT_FORMATS)}")
+    encode = Hotel.encoded if cache else encode_hotel
+
+    if fmt == 'ndjson':
+        for hotel in hotels:
+            out.write(encode(hotel, fmt))
+            out.write('\n')
+        return
+
+    opener, separator, closer = ('[\n', ',\n', '\n]') if fmt == 'pretty' else ('[', ',', ']')
+    empty = True
+    for hotel in hotels:
+        out.write(separator if not empty else opener)
+        out.write(encode(hotel, fmt))
+        empty = False
+    out.write('[]' if empty else closer)
+
+def render_hotels(hotels: Iterable[Hotel], fmt: str = 'pretty', cache: bool = False) -> str:
+    out = io.StringIO()
+    write_hotels(hotels, out, fmt, cache)
+    return out.getvalue()
+
+def parse_ids(value: str) -> Optional[List[str]]:
+    return value.split(',') if value.lower() != 'none' else None
+
+def parse_percentile(value: str) -> float:
+    """A fraction in (0, 1]"""
+    percentile = float(value)
+    if not 0.0 < percentile <= 1.0:
+        raise ValueError(f"Invalid percentile {value}, expected a number in (0, 1]")
+    return percentile
+
+def parse_limit(value: str) -> int:
+    """A non-negative result count"""
+    limit = int(value)
+    if limit < 0:
+        raise ValueError(f"Invalid limit {value}, expected a non-negative integer")
+    return limit
+
+def parse_radius(value: str) -> Tuple[float, float, float]:
+    """'LAT,LNG,KM' as floats"""
+    lat, lng, km = parse_floats(value, 3)
+    if not -90.0 <= lat <= 90.0 or not -180.0 <= lng <= 180.0 or km < 0:
+        raise ValueError(f"Invalid radius {value}, expected LAT,LNG,KM")
+    return lat, lng, km
+
+def parse_bbox(value: str) -> Tuple[float, float, float, float]:
+    """'SOUTH,WEST,NORTH,EAST' as floats"""
+    south, west, north, east = parse_floats(value, 4)
+    if not -90.0 <= south <= north <= 90.0 or not -180.0 <= west <= 180.0 or not -180.0 <= east <= 180.0:
+        raise ValueError(f"Invalid bounding box {value}, expected SOUTH,WEST,NORTH,EAST")
+    return south, west, north, east
+
+def parse_floats(value: str, count: int) -> Tuple[float, ...]:
+    numbers = tuple(float(part) for part in value.split(','))
+    if len(numbers) != count or not all(map(math.isfinite, numbers)):
+        raise ValueError(f"Expected {count} comma-separated numbers, got {value}")
+    return numbers
+
+async def fetch_hotels(hotel_ids: List[str], destination_ids: List[str],
+                       service: Optional[HotelService] = None,
+                       radius: Optional[Tuple[float, float, float]] = None,
+                       bbox: Optional[Tuple[float, float, float, float]] = None,
+                       text: Optional[str] = None, limit: Optional[int] = None) -> str:
+    async with service or HotelService() as service:
+        await service.fetch_all(query=HotelQuery.build(hotel_ids))
+        filtered_hotels = service.find(hotel_ids, destination_ids, radius, bbox, text, limit)
+        return render_hotels(filtered_hotels)
+
+async def stream_hotels(hotel_ids: List[str], destination_ids: List[str], out: TextIO,
+                        fmt: str = 'pretty', service: Optional[HotelService] = None,
+                        radius: Optional[Tuple[float, float, float]] = None,
+                        bbox: Optional[Tuple[float, float, float, float]] = None,
+                        text: Optional[str] = None, limit: Optional[int] = None) -> None:
+    """Fetch and write the matching hotels, followed by a newline.
+
+    The output is flushed before the service closes, so background cache
+    revalidations finish after the result is already out.
+    """
+    async with service or HotelService() as service:
+        await service.fetch_all(query=HotelQuery.build(hotel_ids))
+        write_hotels(service.find(hotel_ids, destination_ids, radius, bbox, text, limit), out, fmt)
+        if fmt != 'ndjson':
+            out.write('\n')
+        out.flush()
+
+class HotelServer:
+    """Answers fetch_hotels-style queries from a warm in-memory catalog.
+
+    GET /hotels?hotel_ids=<ids|none>&destination_ids=<ids|none> returns the
+    same JSON as the CLI; radius=LAT,LNG,KM and bbox=SOUTH,WEST,NORTH,EAST
+    narrow it down to an area, text=<words> ranks it by relevance and
+    limit=<n> caps it. The catalog is loaded once before the server starts
+    listening and refreshed in the background every refresh_interval seconds,
+    so queries never wait on suppliers. With a catalog snapshot the server
+    starts listening at once and refreshes in the background; until that
+    refresh completes, radius, bbox and text queries get 503.
+    """
+
+    def __init__(self, service: HotelService, host: str = '127.0.0.1', port: int = 8080,
+                 refresh_interval: float = 300.0):
+        self.service = service
+        self.host = host
+        self.port = port
+        self.refresh_interval = refresh_interval
+
+    async def serve_forever(self) -> None:
+        snapshot = self.service.snapshot
+        if snapshot is None:
+            await self.service.fetch_all()
+        server = await asyncio.start_server(self.handle, self.host, self.port)
+        # A snapshot is served right away and brought up to date in the background
+        refresher = asyncio.ensure_future(self.refresh_forever(immediately=snapshot is not None))
+        count = len(snapshot) if snapshot is not None else len(self.service.hotels)
+        print(f"Serving {count} hotels on http://{self.host}:{self.port}/hotels")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            refresher.cancel()
+            await self.service.aclose()
+
+    async def refresh_forever(self, immediately: bool = False) -> None:
+        while True:
+            if not immediately:
+                await asyncio.sleep(self.refresh_interval)
+            immediately = False
+            try:
+                await self.service.fetch_all()
+            except Exception as e:
+                print(f"Error refreshing hotels: {str(e)}")
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                keep_alive = True
+                while True:
+                    header = await reader.readline()
+                    if header in (b'\r\n', b'\n', b''):
+                        break
+                    if header.lower().replace(b' ', b'').startswith(b'connection:close'):
+                        keep_alive = False
+
+                status, content_type, body = self.respond(request_line)
+                payload = body.encode('utf-8')
+                writer.write((
+                    f"HTTP/1.1 {status}\r\n"
+                    f"Content-Type: {content_type}\r\n"
+                    f"Content-Length: {len(payload)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+                ).encode('latin-1') + payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def respond(self, request_line: bytes) -> Tuple[str, str, str]:
+        """Status line, content type and body for one request"""
+        parts = request_line.decode('latin-1').split()
+        if len(parts) < 2 or parts[0] != 'GET':
+            return self.error('405 Method Not Allowed', 'only GET is supported')
+
+        url = urlsplit(parts[1])
+        if url.path == '/metrics':
+            return '200 OK', 'text/plain; version=0.0.4', self.service.metrics()
+        if url.path != '/hotels':
+            return self.error('404 Not Found', f'unknown path {url.path}')
+
+        query = parse_qs(url.query)
+        hotel_ids = parse_ids(query.get('hotel_ids', ['none'])[0])
+        destination_ids = parse_ids(query.get('destination_ids', ['none'])[0])
+        fmt = query.get('format', ['pretty'])[0]
+        if fmt not in OUTPUT_FORMATS:
+            return self.error('400 Bad Request', f'unknown format {fmt}')
+        try:
+            radius = parse_radius(query['radius'][0]) if 'radius' in query else None
+            bbox = parse_bbox(query['bbox'][0]) if 'bbox' in query else None
+            limit = parse_limit(query['limit'][0]) if 'limit' in query else None
+        except ValueError as e:
+            return self.error('400 Bad Request', str(e))
+        content_type = 'application/x-ndjson' if fmt == 'ndjson' else 'application/json'
+        text = query['text'][0] if 'text' in query else None
+        if self.service.snapshot is not None and (radius is not None or bbox is not None or text is not None):
+            # The snapshot has no spatial or text index; those come with the first refresh
+            return self.error('503 Service Unavailable', 'catalog is still loading, retry shortly')
+        hotels = self.service.find(hotel_ids, destination_ids, radius, bbox, text, limit)
+        return '200 OK', content_type, render_hotels(hotels, fmt, cache=True)
+
+    @staticmethod
+    def error(status: str, message: str) -> Tuple[str, str, str]:
+        return status, 'application/json', json.dumps({'error': message})
+
+def add_common_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument('--max-connections', type=int, default=ClientConfig.max_connections,
+                        help='Maximum pooled connections shared by all suppliers')
+    parser.add_argument('--http2', action='store_true', help='Use HTTP/2 when available')
+    parser.add_argument('--json-backend', choices=sorted(CODECS),
+                        help='JSON library for supplier payloads and output (default: fastest installed)')
+    parser.add_argument('--cache-dir', help='Cache raw supplier responses in this directory')
+    parser.add_argument('--cache-ttl', type=float, default=300.0,
+                        help='Seconds a cached response is used without contacting the supplier')
+    parser.add_argument('--cache-stale-ttl', type=float, default=86400.0,
+                        help='Further seconds a stale response is used while it is refreshed in the background')
+    parser.add_argument('--offline', action='store_true',
+                        help=f'Serve only from the response cache (default directory: {DEFAULT_CACHE_DIR})')
+    parser.add_argument('--stream-parse', action='store_true',
+                        help='Parse supplier payloads incrementally as they arrive to bound memory')
+    parser.add_argument('--timeout', type=float, default=ClientConfig.timeout,
+                        help='Seconds before a single supplier request times out')
+    parser.add_argument('--retries', type=int, default=RetryPolicy.max_attempts,
+                        help='Attempts per supplier request for transient failures')
+    parser.add_argument('--deadline', type=float,
+                        help='Seconds a fetch may take; slower suppliers are cut off')
+    parser.add_argument('--breaker-threshold', type=int, default=BreakerConfig.failure_threshold,
+                        help='Consecutive failures that open a supplier\'s circuit')
+    parser.add_argument('--breaker-recovery', type=float, default=BreakerConfig.recovery_timeout,
+                        help='Seconds an open circuit waits before probing the supplier again')
+    parser.add_argument('--hedge-percentile', type=parse_percentile,
+                        help='Hedge supplier requests slower than this latency percentile (e.g. 0.95); '
+                             'with a cache directory, latencies carry over between runs')
+    parser.add_argument('--hedge-budget', type=float, default=HedgePolicy.budget,
+                        help='Maximum hedged requests as a fraction of all requests')
+    parser.add_argument('--parse-workers', type=int,
+                        help='Parse large supplier payloads in this many worker processes (0: one per CPU)')
+    parser.add_argument('--resolve-entities', action='store_true',
+                        help='Match hotels across suppliers by destination, location, name and address '
+                             'when their ids differ')
+    parser.add_argument('--snapshot',
+                        help='Load the merged catalog from this snapshot file and save it there after each fetch')
+    parser.add_argument('--parse-threshold', type=int, default=1 << 20,
+                        help='Payload size in bytes from which parsing moves to the worker processes')
+
+def build_service(args: argparse.Namespace) -> HotelService:
+    if args.json_backend:
+        select_codec(args.json_backend)
+    client_config = ClientConfig(max_connections=args.max_connections, http2=args.http2,
+                                 timeout=args.timeout)
+    cache = None
+    if args.cache_dir or args.offline:
+        cache = ResponseCache(args.cache_dir or DEFAULT_CACHE_DIR, args.cache_ttl,
+                              args.cache_stale_ttl, args.offline)
+    return HotelService(client_config, cache, streaming=args.stream_parse,
+                        retry_policy=RetryPolicy(max_attempts=args.retries), deadline=args.deadline,
+                        breaker_config=BreakerConfig(args.breaker_threshold, args.breaker_recovery),
+                        hedge_policy=(HedgePolicy(args.hedge_percentile, args.hedge_budget)
+                                      if args.hedge_percentile is not None else None),
+                        parser_pool=(ParserPool(args.parse_workers or None, args.parse_threshold)
+                                     if args.parse_workers is not None else None),
+                        resolver=EntityResolver() if args.resolve_entities else None,
+                        snapshot_path=args.snapshot)
+
+def serve(argv: List[str]) -> None:
+    parser = argparse.ArgumentParser(prog='serve', description='Serve hotel queries from a warm catalog')
+    parser.add_argument('--host', default='127.0.0.1', help='Interface to listen on')
+    parser.add_argument('--port', type=int, default=8080, help='Port to listen on')
+    parser.add_argument('--refresh-interval', type=float, default=300.0,
+                        help='Seconds between background supplier refreshes')
+    add_common_arguments(parser)
+
+    args = parser.parse_args(argv)
+
+    service = build_service(args)
+    server = HotelServer(service, args.host, args.port, args.refresh_interval)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
 
 def main():
+    if sys.argv[1:2] == ['serve']:
+        serve(sys.argv[2:])
+        return
+
     parser = argparse.ArgumentParser(description='Hotel data fetcher')
     parser.add_argument('hotel_ids', help='Comma-separated hotel IDs or "none"')
     parser.add_argument('destination_ids', help='Comma-separated destination IDs or "none"')
+    add_common_arguments(parser)
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default='pretty',
+                        help='Indented JSON, compact JSON or one hotel per line (NDJSON)')
+    parser.add_argument('--output', help='Write to this file instead of stdout')
+    parser.add_argument('--radius', type=parse_radius, metavar='LAT,LNG,KM',
+                        help='Only hotels within KM kilometres of a point, nearest first')
+    parser.add_argument('--bbox', type=parse_bbox, metavar='SOUTH,WEST,NORTH,EAST',
+                        help='Only hotels inside a bounding box (WEST > EAST crosses the antimeridian)')
+    parser.add_argument('--text', help='Rank hotels by relevance to these words (name, description, amenities)')
+    parser.add_argument('--limit', type=parse_limit, metavar='N', help='Return at most this many hotels')
     
     args = parser.parse_args()
     
-    hotel_ids = args.hotel_ids.split(',') if args.hotel_ids.lower() != 'none' else None
-    destination_ids = args.destination_ids.split(',') if args.destination_ids.lower() != 'none' else None
+    hotel_ids = parse_ids(args.hotel_ids)
+    destination_ids = parse_ids(args.destination_ids)
+    service = build_service(args)
     
-    result = asyncio.run(fetch_hotels(hotel_ids, destination_ids))
-    print(result)
+    out = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    try:
+        asyncio.run(stream_hotels(hotel_ids, destination_ids, out, args.format, service,
+                                  args.radius, args.bbox, args.text, args.limit))
+    finally:
+        if out is not sys.stdout:
+            out.close()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
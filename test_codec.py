@@ -0,0 +1,29 @@
+"""Tests that every JSON backend writes exactly what the standard library writes."""
+from collections import OrderedDict
+
+import pytest
+
+import hotels
+
+pytestmark = pytest.mark.skipif(hotels.orjson is None, reason='orjson is not installed')
+
+DOCUMENTS = {
+    'small floats': [0.00005, 1.5e-05, 1e-07, 0.0001, 0.1, 1 / 3, -0.0, 5e-324],
+    'large exponents': [1e16, 1e22, 1.5e+300, 1e15, 123456789012345.6, -1.7976931348623157e+308],
+    'nan and infinity': {'lat': float('nan'), 'lng': float('inf'), 'alt': float('-inf')},
+    'del': 'caf\x7f',
+    'control characters': '\x00\x08\x0b\x1f\t\n\r"\\/',
+    'non-ascii': ['café', 'Nº', '☃', ' ', '\U0001f600', 'ｓｉｎｇａｐｏｒｅ'],
+    'non-string keys': {1: 'one', 2.5: 'two and a half', True: 'yes', None: 'none'},
+    'nested non-string keys': [OrderedDict([('id', 'iJhz'), ('rooms', {101: ['tv'], 102: []})])],
+    'big integers': [2 ** 63 - 1, 2 ** 64, -2 ** 70],
+    'words that look like literals': ['null', 'nullable', '1e5', '0.00001 km', 'E-5'],
+    'hotel': OrderedDict([('id', 'iJhz'), ('location', OrderedDict([('lat', 1.264751), ('lng', 103.824006)])),
+                          ('amenities', ('pool', 'wifi')), ('booking_conditions', [])]),
+}
+
+
+@pytest.mark.parametrize('indent', [False, True])
+@pytest.mark.parametrize('document', DOCUMENTS.values(), ids=DOCUMENTS.keys())
+def test_orjson_dumps_like_the_standard_library(document, indent):
+    assert hotels.OrjsonCodec().dumps(document, indent) == hotels.JsonCodec().dumps(document, indent)
@@ -0,0 +1,150 @@
+"""Tests for the merge rules and the catalog built from supplier records."""
+import itertools
+
+import hotels
+from hotels import Amenities, Hotel, Image, Images, Location
+
+
+def copy(hotel):
+    return hotels.hotel_from_row(hotels.hotel_to_row(hotel))
+
+
+def merged(*records):
+    result = copy(records[0])
+    for record in records[1:]:
+        result.merge(copy(record))
+    return result
+
+
+def records():
+    """Three suppliers' records of one hotel that disagree on most fields"""
+    return [
+        Hotel(id='iJhz', destination_id='5432', name='Beach Villas Singapore',
+              location=Location(lat=1.264751, lng=103.824006, address='8 Sentosa Gateway, Beach Villas, 098269',
+                                city='Singapore', country='SG'),
+              description='This 5 star hotel is located on the coastline of Singapore.',
+              amenities=Amenities(general=['pool', 'business center', 'wifi']),
+              source='acme'),
+        Hotel(id='iJhz', destination_id='5432', name='Beach Villas Singapore',
+              location=Location(address='8 Sentosa Gateway, Beach Villas, 098269', country='Singapore'),
+              description='Surrounded by tropical gardens, these upscale villas offer a luxury stay.',
+              amenities=Amenities(general=['outdoor pool', 'wifi'], room=['tv', 'kettle']),
+              images=Images(rooms=[Image('https://d2ey9sqrvkqdfs.cloudfront.net/0qZF/2.jpg', 'Double room')],
+                            site=[Image('https://d2ey9sqrvkqdfs.cloudfront.net/0qZF/1.jpg', 'Front')]),
+              booking_conditions=['All children are welcome.'],
+              source='paperflies'),
+        Hotel(id='iJhz', destination_id='5432', name='Beach Villas Singapore Resort',
+              location=Location(lat=1.264751, lng=103.824007, address='8 Sentosa Gateway'),
+              description='Located at the western tip of Resorts World Sentosa.',
+              amenities=Amenities(room=['aircon', 'tv', 'bathtub']),
+              images=Images(rooms=[Image('http://d2ey9sqrvkqdfs.cloudfront.net:80/0qZF/2.jpg#top', 'Double room view'),
+                                   Image('https://d2ey9sqrvkqdfs.cloudfront.net/0qZF/3.jpg', 'Double room')],
+                            amenities=[Image('https://d2ey9sqrvkqdfs.cloudfront.net/0qZF/0.jpg', 'RWS')]),
+              source='patagonia'),
+    ]
+
+
+def test_merge_is_commutative():
+    expected = merged(*records()).to_dict()
+    for order in itertools.permutations(records()):
+        assert merged(*order).to_dict() == expected
+
+
+def test_merge_is_associative():
+    a, b, c = records()
+    assert merged(merged(a, b), c).to_dict() == merged(a, merged(b, c)).to_dict()
+    assert merged(merged(a, c), b).to_dict() == merged(a, merged(c, b)).to_dict()
+
+
+def test_merge_keeps_one_image_per_canonical_link():
+    rooms = merged(*records()).images.rooms
+    assert [image.description for image in rooms] == ['Double room view', 'Double room']
+
+
+def test_merge_reports_changes_only_once():
+    a, b, c = records()
+    hotel = merged(a, b, c)
+    assert not hotel.merge(copy(b))
+    assert not hotel.merge(merged(c, a))
+
+
+def beach_villas(hotel_id, source, name='Beach Villas Singapore', address='8 Sentosa Gateway, Beach Villas',
+                 lat=1.264751, lng=103.824006):
+    return Hotel(id=hotel_id, destination_id='5432', name=name,
+                 location=Location(lat=lat, lng=lng, address=address), source=source)
+
+
+def test_resolver_matches_records_with_different_ids():
+    resolver = hotels.EntityResolver()
+    assert resolver.resolve(beach_villas('iJhz', 'acme')) == 'iJhz'
+    assert resolver.resolve(beach_villas('BV-01', 'patagonia', address='8 Sentosa Gateway, Beach Villas, 098269',
+                                         lng=103.824009)) == 'iJhz'
+    assert resolver.resolve(beach_villas('bv1', 'paperflies', name='Beach Villas, Singapore', address='')) == 'iJhz'
+
+
+def test_resolver_keeps_nearby_hotel_with_other_address_apart():
+    resolver = hotels.EntityResolver()
+    resolver.resolve(beach_villas('iJhz', 'acme'))
+    resolver.resolve(beach_villas('iJhz', 'paperflies', address='8 Sentosa Gateway, Beach Villas, 098269'))
+    annex = beach_villas('BVAX', 'patagonia', name='Beach Villas Singapore Annex', address='10 Sentosa Gateway',
+                         lat=1.26480, lng=103.82410)
+    assert resolver.resolve(annex) == 'BVAX'
+    assert resolver.matches == 0
+
+
+def test_resolver_signs_a_new_record_once(monkeypatch):
+    resolver = hotels.EntityResolver()
+    resolver.resolve(beach_villas('iJhz', 'acme'))
+    signed = []
+    signature = resolver.signature
+    monkeypatch.setattr(resolver, 'signature', lambda text: signed.append(text) or signature(text))
+    resolver.resolve(beach_villas('BV-01', 'patagonia'))
+    resolver.resolve(beach_villas('BV-01', 'patagonia'))
+    assert signed == ['Beach Villas Singapore', '8 Sentosa Gateway, Beach Villas']
+
+
+def test_resolver_indexes_a_renamed_record_anew():
+    resolver = hotels.EntityResolver()
+    resolver.resolve(beach_villas('iJhz', 'acme'))
+    resolver.resolve(beach_villas('iJhz', 'acme', name='Sentosa Cove Lodge', address='2 Cove Way',
+                                  lat=1.2455, lng=103.8400))
+    assert resolver.resolve(beach_villas('BV-01', 'patagonia')) == 'BV-01'
+    assert resolver.resolve(beach_villas('SCL', 'paperflies', name='Sentosa Cove Lodge', address='2 Cove Way',
+                                         lat=1.2455, lng=103.8400)) == 'iJhz'
+
+
+def test_catalog_merge_leaves_records_untouched():
+    supplied = records()
+    before = [(hotel.to_dict(), hotel.sources) for hotel in supplied]
+    catalog = hotels.Catalog()
+    catalog.merge(supplied)
+    assert [(hotel.to_dict(), hotel.sources) for hotel in supplied] == before
+    assert catalog.hotels['iJhz'].to_dict() == merged(*records()).to_dict()
+    assert all(hotel is not catalog.hotels['iJhz'] for hotel in supplied)
+
+
+def test_catalog_normalizes_images_of_single_supplier_hotels():
+    hotel = records()[2]
+    hotel.images.rooms.append(Image('https://d2ey9sqrvkqdfs.cloudfront.net/0qZF/2.jpg', 'Double'))
+    catalog = hotels.Catalog()
+    catalog.merge([hotel])
+    rooms = catalog.hotels['iJhz'].images.rooms
+    assert [(image.link, image.description) for image in rooms] == [
+        ('http://d2ey9sqrvkqdfs.cloudfront.net:80/0qZF/2.jpg#top', 'Double room view'),
+        ('https://d2ey9sqrvkqdfs.cloudfront.net/0qZF/3.jpg', 'Double room')]
+    assert catalog.hotels['iJhz'].images == merged(hotel, hotel).images
+
+
+def test_catalog_forgets_delisted_records_in_the_resolver():
+    catalog = hotels.Catalog(hotels.EntityResolver())
+    catalog.merge([beach_villas('iJhz', 'acme'), beach_villas('BV-01', 'patagonia')])
+    resolver = catalog.resolver
+    assert resolver.aliases == {'BV-01': 'iJhz'}
+    catalog.rebuild(catalog.update('acme', catalog.changes('acme').result()))
+    assert resolver.members == {'iJhz': {'patagonia': 'BV-01'}}
+    assert list(resolver.indexed) == [('patagonia', 'BV-01')]
+    assert catalog.hotels['iJhz'].source == 'patagonia'
+    catalog.rebuild(catalog.update('patagonia', catalog.changes('patagonia').result()))
+    assert catalog.hotels == {}
+    assert resolver.members == resolver.aliases == resolver.indexed == resolver.records == {}
+    assert resolver.buckets == resolver.cells == {}
@@ -0,0 +1,47 @@
+"""Tests for parsing large supplier payloads in spans, as the parser pool's workers do."""
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import hotels
+from test_service import supplier_payloads
+
+
+def paperflies_records(count):
+    template = supplier_payloads()['paperflies'][0]
+    records = []
+    for i in range(count):
+        record = json.loads(json.dumps(template))
+        record['hotel_id'] = f'h{i:04d}'
+        record['hotel_name'] = f'Villa Nº{i}, "Beach" [Sentosa]'
+        records.append(record)
+    return records
+
+
+def parse(payload, **options):
+    # Threads stand in for the worker processes, which could not import
+    # the module as the tests load it
+    pool = hotels.ParserPool(threshold=0, **options)
+    pool._executor = ThreadPoolExecutor(2)
+    try:
+        return asyncio.run(pool.parse(hotels.PaperfliesSupplier(), 'paperflies', payload))
+    finally:
+        pool.shutdown()
+
+
+@pytest.mark.parametrize('indent', [None, 2])
+@pytest.mark.parametrize('chunk_size, overhang', [(100, 50), (777, 4000), (1 << 20, 1 << 16)])
+def test_spans_parse_like_the_whole_payload(indent, chunk_size, overhang):
+    payload = json.dumps(paperflies_records(40), indent=indent, ensure_ascii=False).encode('utf-8')
+    expected = hotels.PaperfliesSupplier().load('paperflies', payload, {})
+    assert parse(payload, chunk_size=chunk_size, overhang=overhang) == expected
+
+
+@pytest.mark.parametrize('payload', [b'[', b'{}', b'[{"hotel_id": "a"},]', b'[{"hotel_id": "a"}] []',
+                                     b'[{"hotel_id": "a"}], {}]', b'[{"hotel_id": "\xff"}]'])
+def test_invalid_payload_is_rejected(payload, capsys):
+    with pytest.raises(ValueError, match='Invalid response format from paperflies'):
+        parse(payload, chunk_size=4)
+    assert capsys.readouterr().out == ''
@@ -0,0 +1,237 @@
+"""Tests for catalog refreshes against suppliers served by httpx.MockTransport."""
+import asyncio
+
+import httpx
+import pytest
+
+import hotels
+
+
+def supplier_payloads():
+    """Each supplier's raw records: iJhz comes from all three, f8c9 from two"""
+    return {
+        'acme': [
+            {'Id': 'iJhz', 'DestinationId': 5432, 'Name': 'Beach Villas Singapore', 'Latitude': 1.264751,
+             'Longitude': 103.824006, 'Address': '8 Sentosa Gateway, Beach Villas', 'City': 'Singapore',
+             'Country': 'SG', 'Description': 'This 5 star hotel is located on the coastline of Singapore.',
+             'Facilities': ['Pool', 'BusinessCenter', 'WiFi ']},
+            {'Id': 'SjyX', 'DestinationId': 5432, 'Name': 'InterContinental Singapore Robertson Quay',
+             'Latitude': None, 'Longitude': None, 'Address': '1 Nanson Road', 'City': 'Singapore',
+             'Country': 'SG', 'Description': 'Sophisticated waterfront living.', 'Facilities': ['Pool']},
+        ],
+        'paperflies': [
+            {'hotel_id': 'iJhz', 'destination_id': 5432, 'hotel_name': 'Beach Villas Singapore',
+             'location': {'address': '8 Sentosa Gateway, Beach Villas, 098269', 'country': 'Singapore'},
+             'details': 'Surrounded by tropical gardens, these upscale villas offer a luxury stay.',
+             'amenities': {'general': ['outdoor pool', 'childcare'], 'room': ['tv', 'kettle']},
+             'images': {'rooms': [{'link': 'https://d2ey9sqrvkqdfs.cloudfront.net/0qZF/2.jpg',
+                                   'caption': 'Double room'}],
+                        'site': [{'link': 'https://d2ey9sqrvkqdfs.cloudfront.net/0qZF/1.jpg', 'caption': 'Front'}]},
+             'booking_conditions': ['All children are welcome.']},
+            {'hotel_id': 'f8c9', 'destination_id': 1122, 'hotel_name': 'Hilton Tokyo Shinjuku',
+             'location': {'address': '160-0023, SHINJUKU-KU, 6-6-2 NISHI-SHINJUKU, JAPAN', 'country': 'Japan'},
+             'details': "10 minutes' walk from Shinjuku train station.",
+             'amenities': {'general': ['indoor pool', 'wifi'], 'room': ['tv', 'minibar']},
+             'images': {'rooms': [{'link': 'https://d2ey9sqrvkqdfs.cloudfront.net/YwAr/i10_m.jpg',
+                                   'caption': 'Suite'}], 'site': []},
+             'booking_conditions': []},
+        ],
+        'patagonia': [
+            {'id': 'iJhz', 'destination': 5432, 'name': 'Beach Villas Singapore', 'lat': 1.264751,
+             'lng': 103.824006, 'address': '8 Sentosa Gateway, Beach Villas',
+             'info': 'Located at the western tip of Resorts World Sentosa.', 'amenities': ['Aircon', 'Tv'],
+             'images': {'rooms': [{'url': 'https://d2ey9sqrvkqdfs.cloudfront.net/0qZF/4.jpg',
+                                   'description': 'Bathroom'}], 'amenities': []}},
+            {'id': 'f8c9', 'destination': 1122, 'name': 'Hilton Tokyo', 'lat': 35.6926, 'lng': 139.690965,
+             'address': None, 'info': None, 'amenities': None, 'images': {'rooms': [], 'amenities': []}},
+        ],
+    }
+
+
+class Suppliers:
+    """The three suppliers' endpoints, answering from payloads.
+
+    With an ETag set for a supplier, a request carrying it in If-None-Match
+    gets 304. failures holds, per supplier, statuses or exceptions that the
+    next requests get instead of the payload (None lets one through), and
+    delays the seconds each supplier takes to answer, or a list of them for
+    its next requests. Requests with page and limit parameters get that page
+    of the payload.
+    """
+
+    def __init__(self):
+        self.payloads = supplier_payloads()
+        self.etags = {}
+        self.failures = {}
+        self.delays = {}
+        self.requests = []
+
+    async def handle(self, request):
+        name = request.url.path.rsplit('/', 1)[-1]
+        self.requests.append((name, request.headers.get('If-None-Match')))
+        delay = self.delays.get(name, 0)
+        await asyncio.sleep(delay.pop(0) if isinstance(delay, list) else delay)
+        if self.failures.get(name):
+            failure = self.failures[name].pop(0)
+            if isinstance(failure, Exception):
+                raise failure
+            if failure is not None:
+                return httpx.Response(failure)
+        headers = {'ETag': self.etags[name]} if name in self.etags else {}
+        if name in self.etags and request.headers.get('If-None-Match') == self.etags[name]:
+            return httpx.Response(304, headers=headers)
+        records = self.payloads[name]
+        if 'page' in request.url.params:
+            limit = int(request.url.params['limit'])
+            start = (int(request.url.params['page']) - 1) * limit
+            records = records[start:start + limit]
+        return httpx.Response(200, json=records, headers=headers)
+
+    def service(self, **options):
+        options.setdefault('retry_policy', hotels.RetryPolicy(backoff=0.0))
+        service = hotels.HotelService(**options)
+        service._client = httpx.AsyncClient(transport=httpx.MockTransport(self.handle))
+        return service
+
+
+def refresh(service, times=1):
+    async def run():
+        for _ in range(times):
+            await service.fetch_all()
+    asyncio.run(run())
+
+
+@pytest.fixture
+def suppliers():
+    return Suppliers()
+
+
+@pytest.mark.parametrize('streaming', [False, True])
+def test_unchanged_refresh_keeps_every_hotel(suppliers, streaming):
+    suppliers.etags = {'acme': '"a1"', 'paperflies': '"p1"', 'patagonia': '"g1"'}
+    service = suppliers.service(streaming=streaming)
+    refresh(service)
+    before = dict(service.hotels)
+    encoded = before['iJhz'].encoded('compact')
+    refresh(service)
+    assert [name for name, etag in suppliers.requests[3:]] == ['acme', 'paperflies', 'patagonia']
+    assert all(etag for _, etag in suppliers.requests[3:])
+    assert service.hotels == before
+    assert all(service.hotels[hotel_id] is hotel for hotel_id, hotel in before.items())
+    assert service.hotels['iJhz']._encoded == {'compact': encoded}
+
+
+@pytest.mark.parametrize('streaming', [False, True])
+def test_refresh_rebuilds_only_changed_hotels(suppliers, streaming):
+    suppliers.etags = {'acme': '"a1"', 'patagonia': '"g1"'}
+    service = suppliers.service(streaming=streaming)
+    refresh(service)
+    before = dict(service.hotels)
+    suppliers.payloads['paperflies'][1]['hotel_name'] = 'Hilton Tokyo Shinjuku West'
+    refresh(service)
+    assert service.hotels['f8c9'].name == 'Hilton Tokyo Shinjuku West'
+    assert service.hotels['f8c9'] is not before['f8c9']
+    assert service.hotels['iJhz'] is before['iJhz']
+    assert service.hotels['SjyX'] is before['SjyX']
+    assert list(service.hotels) == list(before)
+
+
+def test_refresh_drops_delisted_records(suppliers):
+    service = suppliers.service()
+    refresh(service)
+    del suppliers.payloads['acme'][1]
+    del suppliers.payloads['paperflies'][1]
+    refresh(service)
+    assert list(service.hotels) == ['iJhz', 'f8c9']
+    assert service.hotels['f8c9'].name == 'Hilton Tokyo'
+    assert 'SjyX' not in service.by_destination['5432']
+    assert [hotel.id for hotel in service.find(text='Hilton')] == ['f8c9']
+    assert [hotel.id for hotel in service.find(text='waterfront')] == []
+
+
+def test_failed_supplier_keeps_its_records(suppliers):
+    service = suppliers.service()
+    refresh(service)
+    expected = service.hotels['f8c9'].to_dict()
+    suppliers.payloads['patagonia'][1]['name'] = 'Hilton Tokyo Nishi-Shinjuku'
+    suppliers.failures['paperflies'] = [503, 503, 503]
+    refresh(service)
+    assert service.hotels['f8c9'].to_dict() == expected
+    assert service.hotels['iJhz'].description == supplier_payloads()['paperflies'][0]['details']
+
+
+def test_paginated_supplier_keeps_its_records_when_a_page_fails(suppliers):
+    service = suppliers.service(retry_policy=hotels.RetryPolicy(max_attempts=1))
+    service.suppliers[1].pagination = hotels.Pagination(page_size=1, concurrency=1)
+    refresh(service)
+    assert service.hotels['f8c9'].description == supplier_payloads()['paperflies'][1]['details']
+    suppliers.payloads['paperflies'][0]['details'] = 'Renovated villas surrounded by tropical gardens, with a private pool in every villa.'
+    suppliers.failures['paperflies'] = [None, 500]
+    refresh(service)
+    assert service.hotels['iJhz'].description == supplier_payloads()['paperflies'][0]['details']
+    refresh(service)
+    assert service.hotels['iJhz'].description == 'Renovated villas surrounded by tropical gardens, with a private pool in every villa.'
+    assert service.hotels['f8c9'].description == supplier_payloads()['paperflies'][1]['details']
+
+
+@pytest.mark.parametrize('streaming', [False, True])
+def test_supplier_cut_off_at_the_deadline_keeps_its_records(suppliers, streaming):
+    service = suppliers.service(streaming=streaming, deadline=0.2)
+    refresh(service)
+    expected = service.hotels['iJhz'].to_dict()
+    suppliers.payloads['patagonia'][0]['name'] = 'Beach Villas'
+    suppliers.payloads['patagonia'][0]['lat'] = 1.3
+    suppliers.delays['patagonia'] = 1.0
+    refresh(service)
+    assert service.hotels['iJhz'].to_dict() == expected
+
+
+def test_concurrent_streams_merge_in_supplier_order(suppliers):
+    suppliers.payloads['patagonia'][0]['id'] = 'BV-01'
+    suppliers.payloads['patagonia'].append(
+        {'id': 'XsdP', 'destination': 1122, 'name': 'Park Hyatt Tokyo', 'lat': 35.6856, 'lng': 139.6909,
+         'address': '3-7-1-2 Nishi-Shinjuku', 'info': None, 'amenities': None, 'images': {}})
+    expected = suppliers.service(resolver=hotels.EntityResolver())
+    refresh(expected)
+    # The last supplier answers first
+    suppliers.delays = {'acme': 0.2, 'paperflies': 0.1}
+    streamed = suppliers.service(resolver=hotels.EntityResolver(), streaming=True)
+    refresh(streamed)
+    assert list(streamed.hotels) == list(expected.hotels) == ['iJhz', 'SjyX', 'f8c9', 'XsdP']
+    assert streamed.resolver.aliases == {'BV-01': 'iJhz'}
+    assert [hotel.to_dict() for hotel in streamed.hotels.values()] == [
+        hotel.to_dict() for hotel in expected.hotels.values()]
+
+
+def test_slow_stream_is_hedged_and_the_losing_stream_closed(suppliers):
+    policy = hotels.HedgePolicy(percentile=0.5, budget=1.0, min_samples=1)
+    service = suppliers.service(streaming=True, hedge_policy=policy)
+    paperflies = service.suppliers[1]
+    paperflies.hedger.restore([0.05])
+    suppliers.delays['paperflies'] = [1.0, 0.0]
+    refresh(service)
+    assert (paperflies.hedger.hedges, paperflies.hedger.hedge_wins) == (1, 1)
+    assert service.hotels['f8c9'].description == supplier_payloads()['paperflies'][1]['details']
+    assert paperflies.limiter.in_flight._value == paperflies.limiter.limit.max_in_flight
+
+
+def test_hedging_latencies_carry_over_between_runs(suppliers, tmp_path):
+    def service():
+        return suppliers.service(cache=hotels.ResponseCache(str(tmp_path), ttl=0.0, stale_ttl=0.0),
+                                 hedge_policy=hotels.HedgePolicy())
+    first = service()
+    refresh(first)
+    second = service()
+    refresh(second)
+    for before, after in zip(first.suppliers, second.suppliers):
+        assert len(before.hedger.latencies) == 1
+        assert list(after.hedger.latencies)[:1] == list(before.hedger.latencies)
+        assert len(after.hedger.latencies) == 2
+
+
+@pytest.mark.parametrize('percentile', [0.0, -0.5, 1.5])
+def test_hedge_percentile_outside_zero_to_one_is_rejected(percentile):
+    with pytest.raises(ValueError):
+        hotels.HedgePolicy(percentile=percentile)
+    with pytest.raises(ValueError):
+        hotels.parse_percentile(str(percentile))
@@ -0,0 +1,88 @@
+"""Tests for the memory-mapped catalog snapshot."""
+import asyncio
+import threading
+
+import pytest
+
+import hotels
+from hotels import Hotel, Location
+from test_hotels import merged, records
+from test_service import Suppliers, refresh
+
+
+def test_snapshot_round_trip(tmp_path):
+    path = str(tmp_path / 'catalog.snapshot')
+    catalog = [
+        merged(*records()),
+        Hotel(id='SjyX', destination_id='5432', name='InterContinental Singapore Robertson Quay ☃',
+              location=Location(lat=1.28976, lng=103.83806), source='patagonia',
+              sources=('patagonia',) * len(hotels.MERGE_FIELDS)),
+        Hotel(id='f8c9', destination_id='1122', name='', source='acme'),
+    ]
+    hotels.CatalogSnapshot.write(catalog, path)
+    snapshot = hotels.CatalogSnapshot(path)
+    try:
+        assert len(snapshot) == 3
+        for expected, actual in zip(catalog, snapshot):
+            assert actual.to_dict() == expected.to_dict()
+            assert (actual.source, actual.sources) == (expected.source, expected.sources)
+        assert snapshot.get('SjyX').name == catalog[1].name
+        assert snapshot.get('missing') is None
+        assert [hotel.id for hotel in snapshot.destination('5432')] == ['iJhz', 'SjyX']
+        assert snapshot.destination('0000') == []
+        assert [hotel.id for hotel in snapshot.find(['f8c9', 'iJhz'], ['5432'])] == ['iJhz']
+    finally:
+        snapshot.close()
+
+
+def test_snapshot_empty_catalog(tmp_path):
+    path = str(tmp_path / 'catalog.snapshot')
+    hotels.CatalogSnapshot.write([], path)
+    snapshot = hotels.CatalogSnapshot(path)
+    try:
+        assert len(snapshot) == 0
+        assert snapshot.get('iJhz') is None
+        assert snapshot.find() == []
+    finally:
+        snapshot.close()
+
+
+def test_snapshot_rejects_other_files(tmp_path):
+    path = tmp_path / 'catalog.snapshot'
+    path.write_bytes(b'not a snapshot')
+    with pytest.raises(ValueError):
+        hotels.CatalogSnapshot(str(path))
+    hotels.CatalogSnapshot.write([Hotel(id='a', destination_id='1', name='A')], str(path))
+    path.write_bytes(path.read_bytes()[:-1])
+    with pytest.raises(ValueError):
+        hotels.CatalogSnapshot(str(path))
+
+
+def test_refresh_writes_the_snapshot_off_the_event_loop(tmp_path, monkeypatch):
+    path = str(tmp_path / 'catalog.snapshot')
+    writers = []
+    write = hotels.CatalogSnapshot.write
+
+    def record_thread(catalog, snapshot_path):
+        writers.append(threading.current_thread())
+        write(catalog, snapshot_path)
+
+    monkeypatch.setattr(hotels.CatalogSnapshot, 'write', record_thread)
+    service = Suppliers().service(snapshot_path=path)
+    refresh(service)
+    assert writers and threading.main_thread() not in writers
+    snapshot = hotels.CatalogSnapshot(path)
+    try:
+        assert [hotel.id for hotel in snapshot] == list(service.hotels)
+    finally:
+        snapshot.close()
+
+
+def test_service_closes_the_snapshot(tmp_path):
+    path = str(tmp_path / 'catalog.snapshot')
+    hotels.CatalogSnapshot.write([Hotel(id='a', destination_id='1', name='A')], path)
+    service = hotels.HotelService(snapshot_path=path)
+    snapshot = service.snapshot
+    asyncio.run(service.aclose())
+    assert service.snapshot is None
+    assert snapshot._mm.closed
@@ -0,0 +1,63 @@
+"""Tests for the incremental JSON array splitter used by the streaming mode."""
+import json
+
+import pytest
+
+import hotels
+
+
+def split(payload, chunk_size, decode=True):
+    stream = hotels.JsonArrayStream(decode=decode)
+    elements = []
+    for start in range(0, len(payload), chunk_size):
+        elements += stream.feed(payload[start:start + chunk_size])
+    stream.close()
+    return elements
+
+
+PAYLOAD_ELEMENTS = [
+    {'id': 'a', 'name': 'quote " and backslash \\', 'tags': ['[', ']', '{', '}', ',']},
+    {'id': 'b', 'nested': [[1, 2], {'x': {'y': []}}], 'escaped': '\\"\\\\'},
+    'café ☃ \\u0041',
+    [],
+    None,
+    -1.5e-3,
+]
+
+
+@pytest.mark.parametrize('ensure_ascii', [True, False])
+
+
+def test_json_array_stream_every_chunk_size(ensure_ascii):
+    payload = json.dumps(PAYLOAD_ELEMENTS, ensure_ascii=ensure_ascii).encode('utf-8')
+    for chunk_size in range(1, len(payload) + 1):
+        assert split(payload, chunk_size) == PAYLOAD_ELEMENTS
+
+
+def test_json_array_stream_every_split_point():
+    payload = json.dumps(PAYLOAD_ELEMENTS).encode('utf-8')
+    for cut in range(len(payload) + 1):
+        stream = hotels.JsonArrayStream()
+        elements = stream.feed(payload[:cut]) + stream.feed(payload[cut:])
+        stream.close()
+        assert elements == PAYLOAD_ELEMENTS
+
+
+def test_json_array_stream_raw_elements():
+    payload = json.dumps(PAYLOAD_ELEMENTS).encode('utf-8')
+    for chunk_size in (1, 7, len(payload)):
+        raw = split(payload, chunk_size, decode=False)
+        assert all(isinstance(element, bytes) for element in raw)
+        assert [json.loads(element) for element in raw] == PAYLOAD_ELEMENTS
+
+
+def test_json_array_stream_empty_array():
+    assert split(b' [ ] ', 1) == []
+
+
+@pytest.mark.parametrize('payload', [b'{"id": 1}', b'x[1]', b'[1, 2', b'[1,,2]', b'[1,]', b'["a\\"]'])
+
+
+def test_json_array_stream_rejects_invalid_payloads(payload):
+    with pytest.raises(ValueError):
+        split(payload, 1)
@@ -0,0 +1,132 @@
+"""Tests for conditional requests, the response cache, retries and circuit breakers against httpx.MockTransport."""
+import asyncio
+
+import httpx
+import pytest
+
+import hotels
+from test_service import Suppliers, refresh
+
+
+@pytest.fixture
+def suppliers():
+    return Suppliers()
+
+
+def requests_to(suppliers, name):
+    return [etag for supplier, etag in suppliers.requests if supplier == name]
+
+
+def test_etag_round_trip(suppliers):
+    suppliers.etags['acme'] = '"a1"'
+    service = suppliers.service()
+    acme = service.suppliers[0]
+    refresh(service, times=2)
+    assert requests_to(suppliers, 'acme') == [None, '"a1"']
+    assert acme.validators == {acme.endpoint(): {'etag': '"a1"'}}
+    suppliers.etags['acme'] = '"a2"'
+    suppliers.payloads['acme'][1]['Name'] = 'InterContinental Robertson Quay'
+    refresh(service, times=2)
+    assert requests_to(suppliers, 'acme') == [None, '"a1"', '"a1"', '"a2"']
+    assert acme.validators == {acme.endpoint(): {'etag': '"a2"'}}
+    assert service.hotels['SjyX'].name == 'InterContinental Robertson Quay'
+
+
+def test_fresh_cache_answers_a_cold_start(suppliers, tmp_path):
+    warm = suppliers.service(cache=hotels.ResponseCache(str(tmp_path)))
+    refresh(warm)
+    requests = len(suppliers.requests)
+    cold = suppliers.service(cache=hotels.ResponseCache(str(tmp_path)))
+    refresh(cold)
+    assert len(suppliers.requests) == requests
+    assert [hotel.to_dict() for hotel in cold.hotels.values()] == [hotel.to_dict() for hotel in warm.hotels.values()]
+
+
+def test_stale_cache_answers_while_it_is_revalidated(suppliers, tmp_path):
+    suppliers.etags['acme'] = '"a1"'
+    refresh(suppliers.service(cache=hotels.ResponseCache(str(tmp_path))))
+    suppliers.etags['acme'] = '"a2"'
+    suppliers.payloads['acme'][1]['Name'] = 'InterContinental Robertson Quay'
+    cache = hotels.ResponseCache(str(tmp_path), ttl=0.0)
+    service = suppliers.service(cache=cache)
+
+    async def run():
+        await service.fetch_all()
+        await cache.drain()
+    asyncio.run(run())
+    assert service.hotels['SjyX'].name == 'InterContinental Singapore Robertson Quay'
+    assert requests_to(suppliers, 'acme') == [None, '"a1"']
+    assert cache.get(service.suppliers[0].endpoint()).validators == {'etag': '"a2"'}
+
+
+def test_failed_supplier_falls_back_to_the_cache(suppliers, tmp_path, capsys):
+    refresh(suppliers.service(cache=hotels.ResponseCache(str(tmp_path))))
+    suppliers.failures['paperflies'] = [503, 503, 503]
+    service = suppliers.service(cache=hotels.ResponseCache(str(tmp_path), ttl=0.0, stale_ttl=0.0))
+    refresh(service)
+    assert 'using cached response' in capsys.readouterr().out
+    assert service.hotels['f8c9'].description == "10 minutes' walk from Shinjuku train station."
+
+
+def test_offline_serves_only_from_the_cache(suppliers, tmp_path, capsys):
+    offline = suppliers.service(cache=hotels.ResponseCache(str(tmp_path), offline=True))
+    refresh(offline)
+    assert suppliers.requests == []
+    assert offline.hotels == {}
+    assert 'no cached response' in capsys.readouterr().out
+    refresh(suppliers.service(cache=hotels.ResponseCache(str(tmp_path))))
+    requests = len(suppliers.requests)
+    offline = suppliers.service(cache=hotels.ResponseCache(str(tmp_path), offline=True))
+    refresh(offline)
+    assert len(suppliers.requests) == requests
+    assert list(offline.hotels) == ['iJhz', 'SjyX', 'f8c9']
+
+
+@pytest.mark.parametrize('failure', [503, 429, httpx.ConnectError('connection refused')])
+def test_transient_failures_are_retried(suppliers, failure):
+    suppliers.failures['acme'] = [failure, failure]
+    service = suppliers.service(retry_policy=hotels.RetryPolicy(max_attempts=3, backoff=0.0))
+    refresh(service)
+    assert len(requests_to(suppliers, 'acme')) == 3
+    assert 'SjyX' in service.hotels
+
+
+def test_permanent_failures_are_not_retried(suppliers):
+    suppliers.failures['acme'] = [404]
+    service = suppliers.service(retry_policy=hotels.RetryPolicy(max_attempts=3, backoff=0.0))
+    refresh(service)
+    assert len(requests_to(suppliers, 'acme')) == 1
+    assert 'SjyX' not in service.hotels
+
+
+def test_breaker_opens_then_probes_half_open(suppliers):
+    suppliers.failures['acme'] = [503] * 3
+    service = suppliers.service(retry_policy=hotels.RetryPolicy(max_attempts=2, backoff=0.0),
+                                breaker_config=hotels.BreakerConfig(failure_threshold=2, recovery_timeout=60.0))
+    breaker = service.suppliers[0].breaker
+    refresh(service)
+    assert breaker.state == breaker.OPEN
+    assert len(requests_to(suppliers, 'acme')) == 2
+
+    refresh(service)
+    assert len(requests_to(suppliers, 'acme')) == 2
+    assert breaker.rejected == 1
+    assert 'SjyX' not in service.hotels
+
+    # The probe after the recovery timeout fails and opens the circuit again
+    breaker.opened_at -= 60.0
+    refresh(service)
+    assert breaker.state == breaker.OPEN
+    assert len(requests_to(suppliers, 'acme')) == 3
+
+    breaker.opened_at -= 60.0
+    suppliers.failures['acme'] = []
+    refresh(service)
+    assert breaker.state == breaker.CLOSED
+    assert 'SjyX' in service.hotels
+    assert breaker.transitions == {
+        (breaker.CLOSED, breaker.OPEN): 1,
+        (breaker.OPEN, breaker.HALF_OPEN): 2,
+        (breaker.HALF_OPEN, breaker.OPEN): 1,
+        (breaker.HALF_OPEN, breaker.CLOSED): 1,
+    }